@@ -134,19 +134,107 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # 带连接池的mysql backend，改回 'django.db.backends.mysql' 即关闭连接池
+        'ENGINE': 'common.db.backends.mysql_pool',
         'NAME': 'blog',
         'HOST': '127.0.0.1',
         'USER': 'root',
         'PASSWORD': '123456',
         'OPTIONS': {
             'charset': 'utf8mb4',
-        }
+        },
+        'POOL': {
+            'MAX_SIZE': 10,
+            'MAX_LIFETIME': 60 * 60,
+            'HEALTH_CHECK_AFTER': 10,
+        },
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 文章Markdown渲染结果缓存，需要多进程共享(warm_md_cache命令在独立进程中预热)，
+    # 默认存本地文件，可替换为redis等后端，不能用进程内的LocMemCache；
+    # 正文修改后旧版本的渲染结果留在缓存中，FileBasedCache在条目数达到MAX_ENTRIES时随机删除1/CULL_FREQUENCY(默认1/3)的条目，
+    # 不是LRU，热门文章也可能被删除后重新渲染；需要LRU时可换成配置了maxmemory-policy allkeys-lru的redis
+    'markdown': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'storage', 'cache', 'markdown'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        }
+    },
+    # 用户token版本号，所有web进程必须共享同一个cache，否则一个进程里的改密、禁用不能让其他进程缓存的token失效；
+    # 本地文件只在单机多进程时共享，多机部署需换成redis等；不与其他key共用，避免被淘汰
+    'token_version': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'storage', 'cache', 'token_version'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000000,
+        }
+    },
+    # 分页总数缓存及其版本号，写入时让所有web进程缓存的总数一起失效，必须多进程共享；多机部署需换成redis等
+    'count': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'storage', 'cache', 'count'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        }
+    },
+}
+
+ARTICLE_MD_CACHE = 'markdown'
+USER_TOKEN_VERSION_CACHE = 'token_version'
+# 分页总数缓存，使用LocMemCache时manage.py check会给出警告
+PAGINATION_COUNT_CACHE = 'count'
+
+# 标签云缓存秒数，文章数变化时会主动失效
+TAG_CLOUD_CACHE_TIMEOUT = 60 * 10
+
+DATABASE_ROUTERS = ['common.db.router.ReadReplicaRouter']
+# 只读副本在DATABASES中的别名，为空时所有查询都走default
+DATABASE_READ_REPLICAS = []
+# 用户写入后多少秒内的读请求仍走主库
+DATABASE_READ_STICKY_SECONDS = 5
+# 记录用户最近写入的cache；配置了只读副本时必须是所有web进程共享的cache(如redis)，
+# 否则写入后的下一个读请求落到其他进程时会读到副本的旧数据，manage.py check会对LocMemCache给出警告
+DATABASE_READ_STICKY_CACHE = 'default'
+
 JWT_EXP_SECOND = 60 * 60 * 2
 
+# token校验结果的进程内缓存：最多缓存的token数、缓存秒数(也是queryset.update等绕过save的修改的最长生效延迟)
+USER_TOKEN_CACHE_SIZE = 10000
+USER_TOKEN_CACHE_TTL = 60
+
+# 登录限流：(次数, 秒)，多进程部署时可改用 common.utils.rate_limit.CacheBackend 配合共享cache
+LOGIN_RATE_LIMIT_BACKEND = 'common.utils.rate_limit.MemoryBackend'
+LOGIN_RATE_LIMIT_USERNAME = (10, 60)
+LOGIN_RATE_LIMIT_IP = (60, 60)
+
+# 接口日志是否写入数据库，关闭后只写日志文件
+API_LOG_SAVE_DB = True
+# 接口日志后台批量写入：队列长度上限(满了丢弃)、每批条数、最长攒批时间(秒)
+API_LOG_QUEUE_SIZE = 10000
+API_LOG_BATCH_SIZE = 200
+API_LOG_FLUSH_INTERVAL = 1
+
+# 后台导出任务的线程数
+EXPORT_JOB_WORKERS = 2
+
+# 文章标题图上传后生成的WebP缩略图 {key: (最大宽, 最大高)}，以及生成用的进程数
+AVATAR_VARIANTS = {
+    'small': (320, 180),
+    'medium': (800, 450),
+}
+AVATAR_VARIANT_WORKERS = 2
+
+
+# 文章全文检索使用的本地SQLite FTS5索引文件
+ARTICLE_SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'storage', 'search', 'article.sqlite3')
 
 LOG_DIR = os.path.join(BASE_DIR, 'log')
 
@@ -0,0 +1,44 @@
+"""
+单元测试用配置：python manage.py test --settings=MyBlog.settings_test
+用两个本地SQLite库代替MySQL，replica作为只读副本
+"""
+from MyBlog.settings import *  # noqa
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test_default.sqlite3'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test_replica.sqlite3'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'markdown': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'markdown',
+        'TIMEOUT': None,
+    },
+    'token_version': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'token_version',
+        'TIMEOUT': None,
+    },
+    'count': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'count',
+    },
+}
+# 测试在单进程中运行，分页总数用LocMemCache不会读到其他进程的旧数据
+SILENCED_SYSTEM_CHECKS = ['common.W002']
+
+ARTICLE_SEARCH_INDEX_PATH = ':memory:'
+
+TEST_RUNNER = 'MyBlog.test_runner.UnmanagedModelTestRunner'
+# 后台线程写日志表会和测试事务抢锁，测试时只写日志文件
+API_LOG_SAVE_DB = False
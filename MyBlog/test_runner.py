@@ -0,0 +1,17 @@
+from django.apps import apps
+from django.test.runner import DiscoverRunner
+
+
+class UnmanagedModelTestRunner(DiscoverRunner):
+    """managed=False的表由线上库维护，测试时也需要建表"""
+
+    def setup_test_environment(self, *args, **kwargs):
+        self.unmanaged_models = [m for m in apps.get_models() if not m._meta.managed]
+        for model in self.unmanaged_models:
+            model._meta.managed = True
+        super().setup_test_environment(*args, **kwargs)
+
+    def teardown_test_environment(self, *args, **kwargs):
+        super().teardown_test_environment(*args, **kwargs)
+        for model in self.unmanaged_models:
+            model._meta.managed = False
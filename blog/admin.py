@@ -1,3 +1,24 @@
 from django.contrib import admin
 
-# Register your models here.
+from blog.models.log import MSApiLog, MSApiLogDaily
+from common.models.admin.base import BaseAdmin, SpentTimeFilter
+
+
+@admin.register(MSApiLog)
+class MSApiLogAdmin(BaseAdmin):
+    readonly = True
+    list_display = ['id', 'method', 'path', 'resp_status', 'spent', 'db_spent', 'db_queries',
+                    'serialize_spent', 'render_spent', 'user', 'date']
+    list_filter = [SpentTimeFilter, 'method', 'date']
+    search_fields = ['path']
+
+
+@admin.register(MSApiLogDaily)
+class MSApiLogDailyAdmin(BaseAdmin):
+    readonly = True
+    list_display = ['date', 'method', 'route', 'count', 'error_count', 'error_rate',
+                    'avg_spent', 'p50', 'p90', 'p99', 'max_spent']
+    list_filter = ['date', 'method']
+    search_fields = ['route']
+    ordering = ['-date', '-p99']
+    exclude = ['histogram']
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        # 注册文章全文检索的增量索引信号
+        from blog import search  # noqa
+        # 注册只读副本、分页总数缓存相关的系统检查
+        from common.db import router  # noqa
+        from common.views import pagination  # noqa
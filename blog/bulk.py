@@ -0,0 +1,210 @@
+"""
+文章批量导入/导出
+
+导入的每一行为 {'title': ..., 'body': ..., 'category': 分类名, 'tags': [标签名, ...]}，
+来源可以是NDJSON(每行一个JSON)，也可以是带front matter的Markdown文件目录：
+    ---
+    title: 标题(缺省为文件名)
+    category: 分类
+    tags: [标签1, 标签2]
+    ---
+    正文
+"""
+import json
+import os
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blog.models.article import Article, Article2Tag, Category, Tag
+from blog.search import index_articles
+
+TITLE_MAX_LENGTH = Article._meta.get_field('title').max_length
+TAG_MAX_LENGTH = Tag._meta.get_field('text').max_length
+CATEGORY_MAX_LENGTH = Category._meta.get_field('title').max_length
+
+
+def parse_ndjson(lines):
+    """逐行解析，返回 (行号, 数据或None, 错误信息或None)"""
+    for line_no, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('UTF-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line), None
+        except ValueError as e:
+            yield line_no, None, '不是合法的JSON: {}'.format(e)
+
+
+def _parse_front_matter_value(value):
+    value = value.strip()
+    if value.startswith('[') and value.endswith(']'):
+        value = value[1:-1]
+        return [v.strip().strip('\'"') for v in value.split(',') if v.strip()]
+    return value.strip('\'"')
+
+
+def parse_markdown(text, default_title=None):
+    row = {'title': default_title, 'body': text}
+    if text.startswith('---'):
+        parts = text.split('\n')
+        for end in range(1, len(parts)):
+            if parts[end].strip() == '---':
+                for line in parts[1:end]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        row[key.strip()] = _parse_front_matter_value(value)
+                row['body'] = '\n'.join(parts[end + 1:]).lstrip('\n')
+                break
+    if isinstance(row.get('tags'), str):
+        row['tags'] = [t.strip() for t in row['tags'].split(',') if t.strip()]
+    return row
+
+
+def parse_markdown_dir(path):
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.md'):
+            continue
+        try:
+            with open(os.path.join(path, name), encoding='UTF-8') as f:
+                yield name, parse_markdown(f.read(), default_title=os.path.splitext(name)[0]), None
+        except (OSError, UnicodeDecodeError) as e:
+            yield name, None, str(e)
+
+
+def clean_row(row):
+    if not isinstance(row, dict):
+        raise ValueError('每一行必须是一个JSON对象')
+    title = row.get('title')
+    body = row.get('body')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError('title不能为空')
+    if len(title) > TITLE_MAX_LENGTH:
+        raise ValueError('title不能超过{}个字符'.format(TITLE_MAX_LENGTH))
+    if not isinstance(body, str):
+        raise ValueError('body必须是字符串')
+    category = row.get('category') or None
+    if category is not None and (not isinstance(category, str) or len(category) > CATEGORY_MAX_LENGTH):
+        raise ValueError('category必须是不超过{}个字符的字符串'.format(CATEGORY_MAX_LENGTH))
+    tags = row.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(t, str) and 0 < len(t) <= TAG_MAX_LENGTH for t in tags):
+        raise ValueError('tags必须是不超过{}个字符的字符串列表'.format(TAG_MAX_LENGTH))
+    return {'title': title.strip(), 'body': body, 'category': category, 'tags': list(dict.fromkeys(tags))}
+
+
+def _get_or_create_many(model, field, values):
+    """按名称批量取得或创建，返回 {名称: id}"""
+    values = set(values)
+    if not values:
+        return {}
+    existing = dict(model.objects.filter(**{field + '__in': values}).values_list(field, 'id'))
+    missing = values - set(existing)
+    if missing:
+        model.objects.bulk_create([model(**{field: v}) for v in missing])
+        # MySQL的bulk_create不会回填主键，重新查询一次
+        existing.update(model.objects.filter(**{field + '__in': missing}).values_list(field, 'id'))
+    return existing
+
+
+class ArticleImporter:
+    def __init__(self, author=None, chunk_size=500):
+        self.author = author
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.errors = []
+
+    def report(self):
+        return {'created': self.created, 'errors': self.errors}
+
+    def run(self, rows):
+        """rows为 (行标识, 数据, 解析错误) 的可迭代对象，按chunk_size分批在各自的事务中写入"""
+        chunk = []
+        for ref, row, error in rows:
+            if error is None:
+                try:
+                    row = clean_row(row)
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                self.errors.append({'row': ref, 'error': error})
+                continue
+            chunk.append((ref, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self.report()
+
+    def import_chunk(self, chunk):
+        try:
+            with transaction.atomic():
+                self._import_chunk([row for _, row in chunk])
+            self.created += len(chunk)
+        except Exception as e:
+            self.errors.extend({'row': ref, 'error': '写入失败: {}'.format(e)} for ref, _ in chunk)
+
+    def _import_chunk(self, rows):
+        categories = _get_or_create_many(Category, 'title', [r['category'] for r in rows if r['category']])
+        tags = _get_or_create_many(Tag, 'text', [t for r in rows for t in r['tags']])
+
+        articles = [Article(author=self.author, title=r['title'], body=r['body'],
+                            category_id=categories.get(r['category'])) for r in rows]
+        self._bulk_create_articles(articles)
+        for category_id, count in Counter(a.category_id for a in articles if a.category_id).items():
+            Category.adjust_article_count([category_id], count)
+        # bulk_create不发post_save信号，整批提交后一次建索引；Markdown在首次读取时渲染并缓存
+        article_ids = [a.id for a in articles]
+        transaction.on_commit(lambda: index_articles(article_ids))
+
+        relations = [Article2Tag(article=article, tag_id=tags[text])
+                     for article, row in zip(articles, rows) for text in row['tags']]
+        Article2Tag.objects.bulk_create(relations, batch_size=self.chunk_size)
+        tag_counts = Counter(r.tag_id for r in relations)
+        for count in set(tag_counts.values()):
+            Tag.adjust_article_count([tag_id for tag_id, c in tag_counts.items() if c == count], count)
+
+    def _bulk_create_articles(self, articles):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Article.objects.bulk_create(articles, batch_size=self.chunk_size)
+            return
+        # MySQL的bulk_create不回填主键：本批文章使用同一个modified作为批次标记，
+        # 写入后在同一事务中按主键顺序读回(多行INSERT按行的顺序分配自增id)
+        batch_token = timezone.now()
+        last_id = Article.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        for article in articles:
+            article.modified = batch_token
+            article.update_modified = False
+        Article.objects.bulk_create(articles, batch_size=self.chunk_size)
+        created = list(Article.objects.filter(id__gt=last_id, modified=batch_token)
+                       .order_by('id').values_list('id', 'title'))
+        if [title for _, title in created] != [a.title for a in articles]:
+            raise RuntimeError('无法读回批量写入的文章主键')
+        for article, (pk, _) in zip(articles, created):
+            article.id = pk
+
+
+def iter_articles_ndjson(queryset=None, chunk_size=500):
+    """按主键分批读取，逐行生成NDJSON，内存占用只与chunk_size有关"""
+    queryset = (queryset if queryset is not None else Article.objects.all()).order_by('id')
+    queryset = queryset.select_related('category').prefetch_related('tags')
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        for article in chunk:
+            yield (json.dumps({
+                'id': article.id,
+                'title': article.title,
+                'body': article.body,
+                'category': article.category.title if article.category else None,
+                'tags': [tag.text for tag in article.tags.all()],
+                'author_id': article.author_id,
+                'created': article.created.isoformat() if article.created else None,
+            }, ensure_ascii=False) + '\n').encode('UTF-8')
+        last_id = chunk[-1].id
@@ -0,0 +1,61 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+from django.utils.dateparse import parse_date
+
+from blog.models.log import MSApiLog
+
+
+class Command(BaseCommand):
+    help = '按天从已有的接口日志重建耗时汇总：写日志时已实时汇总，这里先删除当天的汇总再重算，不会重复计数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='只重建该日期(YYYY-MM-DD)及之后的汇总')
+        parser.add_argument('--until', help='只重建该日期(YYYY-MM-DD)及之前的汇总，默认昨天；'
+                                            '当天仍有日志在写入和实时汇总，重建当天可能重复计数')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def parse_date_option(self, options, name):
+        if not options[name]:
+            return None
+        value = parse_date(options[name])
+        if value is None:
+            raise CommandError('无效的日期: {}'.format(options[name]))
+        return value
+
+    def handle(self, *args, **options):
+        rollup_model = MSApiLog.rollup_model
+        since = self.parse_date_option(options, 'since')
+        # 与BaseApiLog.date的auto_now一致，用本地日期
+        until = self.parse_date_option(options, 'until') or date.today() - timedelta(days=1)
+        logs = MSApiLog.objects.filter(date__lte=until)
+        summaries = rollup_model.objects.filter(date__lte=until)
+        if since:
+            logs = logs.filter(date__gte=since)
+            summaries = summaries.filter(date__gte=since)
+
+        # 有汇总但日志已清理的日期也一并清空
+        dates = sorted(set(logs.dates('date', 'day')) | set(summaries.dates('date', 'day')))
+        total = 0
+        for day in dates:
+            # 删除和重算在同一事务中，其他连接不会读到重算了一半的汇总
+            with atomic():
+                summaries.filter(date=day).delete()
+                count = self.rollup(logs.filter(date=day), rollup_model, options['chunk_size'])
+            total += count
+            self.stdout.write('{}: {} logs'.format(day, count))
+        self.stdout.write(self.style.SUCCESS('done, {} days, {} logs'.format(len(dates), total)))
+
+    def rollup(self, logs, rollup_model, chunk_size):
+        fields = ['id', 'date', 'route', 'path', 'method', 'spent', 'resp_status', 'resp_code']
+        last_id = 0
+        total = 0
+        while True:
+            chunk = list(logs.filter(id__gt=last_id).order_by('id').only(*fields)[:chunk_size])
+            if not chunk:
+                break
+            rollup_model.rollup(chunk)
+            last_id = chunk[-1].id
+            total += len(chunk)
+        return total
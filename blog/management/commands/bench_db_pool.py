@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from common.db.backends.mysql_pool.base import ConnectionPool, DatabaseWrapper as PoolDatabaseWrapper
+from common.utils.bench import run_bench, format_result
+
+
+def _select_one(connection):
+    cursor = connection.cursor()
+    cursor.execute('SELECT 1')
+    cursor.fetchall()
+    cursor.close()
+
+
+class Command(BaseCommand):
+    help = '连接池基准：每次新建连接与从连接池取连接，各自"建立连接+SELECT 1"的耗时分布'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--times', type=int, default=200)
+
+    def handle(self, *args, **options):
+        wrapper = connections[options['database']]
+        params = wrapper.get_connection_params()
+        if isinstance(wrapper, PoolDatabaseWrapper):
+            # 跳过连接池，直接用mysql backend新建连接
+            new_connection = super(PoolDatabaseWrapper, wrapper).get_new_connection
+        else:
+            # 非连接池的backend(如本地SQLite)作为替身，对比的是同一个ConnectionPool
+            new_connection = wrapper.get_new_connection
+
+        def connect():
+            return new_connection(params)
+
+        def without_pool(i):
+            connection = connect()
+            _select_one(connection)
+            connection.close()
+
+        pool = ConnectionPool(max_size=1)
+
+        def with_pool(i):
+            connection, created_at = pool.acquire(connect)
+            _select_one(connection)
+            pool.release(connection, created_at)
+
+        self.stdout.write('{} ({})'.format(options['database'], wrapper.vendor))
+        self.stdout.write(format_result('without pool', run_bench(without_pool, options['times'])))
+        self.stdout.write(format_result('with pool', run_bench(with_pool, options['times'])))
+        pool.clear()
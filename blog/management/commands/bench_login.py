@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework import serializers
+
+from blog.models.account import MSAccount
+from blog.serializers import account as account_serializers
+from common.helper import uuid_str
+from common.utils.bench import run_bench, format_result
+from common.utils.rate_limit import SlidingWindowLimiter, MemoryBackend
+
+
+class _Unlimited:
+    def allow(self, key):
+        return True
+
+    def reset(self, key):
+        pass
+
+
+class Command(BaseCommand):
+    help = '登录吞吐基准：同一账号连续用错误密码登录(撞库)，对比关闭和开启限流时每秒能处理的登录请求数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=10, help='开启限流时每个用户名每分钟允许的次数')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().post('/blog/api/account/login', REMOTE_ADDR='127.0.0.1')
+        with transaction.atomic():
+            # 临时账号，测完回滚
+            username = 'bench-{}'.format(uuid_str()[:8])
+            account = MSAccount(username=username, nickname='bench', phone='13800000000')
+            account.reset_password(uuid_str())
+            account.save()
+
+            def login(i):
+                serializer = account_serializers.AccountLoginSerializer(
+                    data={'username': username, 'password': 'wrong'}, context={'request': request})
+                try:
+                    serializer.is_valid(raise_exception=True)
+                except serializers.ValidationError:
+                    pass
+
+            cases = [
+                ('without limiter', _Unlimited(), _Unlimited()),
+                ('with limiter', SlidingWindowLimiter(options['limit'], 60, MemoryBackend()),
+                 SlidingWindowLimiter(options['limit'] * 6, 60, MemoryBackend())),
+            ]
+            for name, username_limiter, ip_limiter in cases:
+                with mock.patch.object(account_serializers, 'login_username_limiter', username_limiter), \
+                        mock.patch.object(account_serializers, 'login_ip_limiter', ip_limiter):
+                    result = run_bench(login, options['attempts'])
+                self.stdout.write(format_result(name, result))
+            transaction.set_rollback(True)
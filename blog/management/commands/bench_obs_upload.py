@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from common.storage import HuaweiStorage
+from common.utils.bench import run_bench, format_result
+from common.utils.fake_obs import FakeObsClient
+
+HEADERS = {
+    'contentType': 'application/octet-stream',
+    'contentDisposition': 'attachment; filename="download"; filename*=UTF-8\'\'bench.bin',
+}
+
+
+class Command(BaseCommand):
+    help = 'OBS上传基准：用本地fake客户端模拟每次请求的往返时间，对比上传后再设置元数据与随上传写入元数据的uploads/s'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--times', type=int, default=100)
+        parser.add_argument('--size', type=int, default=64 * 1024, help='每个文件的字节数')
+        parser.add_argument('--latency', type=float, default=5, help='每次请求的往返时间(毫秒)')
+
+    def handle(self, *args, **options):
+        data = os.urandom(options['size'])
+        with tempfile.TemporaryDirectory() as cache_dir:
+            storage = HuaweiStorage({
+                'AccessKey': 'ak', 'SecretKey': 'sk', 'Server': 'obs.local', 'URL': 'https://obs.local',
+                'Bucket': 'bench', 'CacheDir': cache_dir,
+            }, client=FakeObsClient(latency=options['latency'] / 1000))
+
+            def content():
+                f = ContentFile(data)
+                f.obs_headers = HEADERS
+                return f
+
+            def set_metadata_after(i):
+                # 旧做法：上传后再单独请求一次设置元数据
+                name = storage.save('bench/a{}.bin'.format(i), ContentFile(data))
+                storage.client.setObjectMetadata(storage.bucket, name, contentType=HEADERS['contentType'],
+                                                 contentDisposition=HEADERS['contentDisposition'])
+
+            def headers_with_upload(i):
+                storage.save('bench/b{}.bin'.format(i), content())
+
+            self.stdout.write('{} bytes, {}ms latency'.format(options['size'], options['latency']))
+            for name, func in [('put + setObjectMetadata', set_metadata_after),
+                               ('put with headers', headers_with_upload)]:
+                # 每个op为一次上传
+                self.stdout.write(format_result(name, run_bench(func, options['times'])))
@@ -0,0 +1,22 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from blog.bulk import iter_articles_ndjson
+
+
+class Command(BaseCommand):
+    help = '以NDJSON格式导出全部文章'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='输出文件，缺省输出到stdout')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for line in iter_articles_ndjson(chunk_size=options['chunk_size']):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,34 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.bulk import ArticleImporter, parse_ndjson, parse_markdown_dir
+from blog.models.account import MSAccount
+
+
+class Command(BaseCommand):
+    help = '批量导入文章，支持NDJSON文件或带front matter的Markdown目录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON文件或Markdown目录')
+        parser.add_argument('--author', help='文章作者的登录名')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            author = MSAccount.objects.filter(username=options['author']).first()
+            if not author:
+                raise CommandError('账号{}不存在'.format(options['author']))
+
+        importer = ArticleImporter(author=author, chunk_size=options['chunk_size'])
+        path = options['path']
+        if os.path.isdir(path):
+            report = importer.run(parse_markdown_dir(path))
+        else:
+            with open(path, encoding='UTF-8') as f:
+                report = importer.run(parse_ndjson(f))
+
+        for error in report['errors']:
+            self.stderr.write('[{}] {}'.format(error['row'], error['error']))
+        self.stdout.write(self.style.SUCCESS('created: {}, errors: {}'.format(report['created'], len(report['errors']))))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog.models.article import Article
+from blog.search import article_index, index_articles
+
+
+class Command(BaseCommand):
+    help = '重建文章全文检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        article_index.clear()
+        chunk_size = options['chunk_size']
+        ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+        for i in range(0, len(ids), chunk_size):
+            index_articles(ids[i:i + chunk_size])
+        self.stdout.write(self.style.SUCCESS('indexed {} articles'.format(len(ids))))
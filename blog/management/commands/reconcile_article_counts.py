@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from blog.models.article import Tag, Category, invalidate_tag_cloud
+
+
+class Command(BaseCommand):
+    help = '按实际关联关系校正标签和分类的冗余文章数'
+
+    def handle(self, *args, **options):
+        fixed_tags = self.reconcile(Tag.objects.annotate(actual=Count('article2tag__article', distinct=True)))
+        fixed_categories = self.reconcile(Category.objects.annotate(actual=Count('articles')))
+        invalidate_tag_cloud()
+        self.stdout.write(self.style.SUCCESS('fixed tags: {}, categories: {}'.format(fixed_tags, fixed_categories)))
+
+    def reconcile(self, queryset):
+        model = queryset.model
+        mismatched = []
+        for obj in queryset.only('id', 'article_count').iterator(chunk_size=1000):
+            if obj.article_count != obj.actual:
+                obj.article_count = obj.actual
+                mismatched.append(obj)
+        model.objects.bulk_update(mismatched, ['article_count'], batch_size=500)
+        return len(mismatched)
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog.models.article import Avatar
+from common.models.files import BaseFileBlob, CommonFileResource, file_root_folder
+
+# SDK把对象的LastModified(UTC)转成本机时区的该格式字符串
+OBS_DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+
+def parse_last_modified(value):
+    """解析对象的lastModified，返回带时区的时间，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        # naive时间按本机时区解释，与SDK的转换一致
+        return datetime.strptime(value, OBS_DATETIME_FORMAT).astimezone(dt_timezone.utc)
+    except ValueError:
+        pass
+    try:
+        modified = parse_datetime(value)
+    except ValueError:
+        return None
+    if modified is not None and timezone.is_naive(modified):
+        modified = timezone.make_aware(modified, dt_timezone.utc)
+    return modified
+
+
+class Command(BaseCommand):
+    help = '比对文件资源记录与存储中的对象，批量删除无记录引用的对象和对象已不存在的记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help='app_label.ModelName，默认处理所有CommonFileResource子类')
+        parser.add_argument('--prefix', help='只比对该前缀下的对象，默认 <root>/file/')
+        parser.add_argument('--min-age', type=int, default=24,
+                            help='只删除上传超过该小时数的无引用对象，避免误删尚未入库的新上传')
+        parser.add_argument('--dry-run', action='store_true', help='只输出统计，不做删除')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix'] if options['prefix'] is not None else '{}/file/'.format(file_root_folder())
+        deadline = timezone.now() - timedelta(hours=options['min_age'])
+        # 同一存储可能被多个model使用，按存储列出对象，只删除所有model都未引用的对象
+        by_storage = {}
+        for model in self.get_models(options['model']):
+            storage = model._meta.get_field('file').storage
+            if not hasattr(storage, 'iter_objects'):
+                raise CommandError('{} 的存储不支持列出对象'.format(model._meta.label))
+            by_storage.setdefault(id(storage), (storage, []))[1].append(model)
+        if not by_storage:
+            return
+        referenced = self.referenced_names()
+        for storage, storage_models in by_storage.values():
+            existing = self.reconcile_objects(storage, prefix, referenced, deadline, options['dry_run'])
+            for model in storage_models:
+                self.reconcile_rows(model, prefix, existing, options['dry_run'])
+
+    def get_models(self, label):
+        if label:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+            if not issubclass(model, CommonFileResource):
+                raise CommandError('{} 不是文件资源model'.format(label))
+            return [model]
+        return [m for m in apps.get_models() if issubclass(m, CommonFileResource)]
+
+    def referenced_names(self):
+        """所有model的文件字段、去重索引中的对象和头像缩略图，任何一处引用的对象都不删除"""
+        names = set()
+        for model in apps.get_models():
+            if model._meta.proxy:
+                continue
+            for field in model._meta.concrete_fields:
+                if isinstance(field, models.FileField):
+                    names.update(model.objects.exclude(**{field.attname: ''})
+                                 .values_list(field.attname, flat=True).iterator())
+            if issubclass(model, BaseFileBlob):
+                names.update(model.objects.values_list('name', flat=True).iterator())
+        for variants in Avatar.objects.values_list('variants', flat=True).iterator():
+            names.update((variants or {}).values())
+        names.discard(None)
+        return names
+
+    def reconcile_objects(self, storage, prefix, referenced, deadline, dry_run):
+        """删除前缀下无引用且早于deadline的对象，返回列出的全部对象名"""
+        orphan_objects = []
+        existing = set()
+        for content in storage.iter_objects(prefix):
+            existing.add(content.key)
+            if content.key in referenced:
+                continue
+            modified = parse_last_modified(content.lastModified)
+            if modified is not None and modified < deadline:
+                orphan_objects.append(content.key)
+
+        self.stdout.write('{}: {} objects without rows'.format(prefix, len(orphan_objects)))
+        if not dry_run:
+            failed = storage.delete_many(orphan_objects)
+            for name, reason in failed:
+                self.stderr.write('delete {} failed: {}'.format(name, reason))
+            self.stdout.write(self.style.SUCCESS('{}: deleted {} objects'.format(
+                prefix, len(orphan_objects) - len(failed))))
+        return existing
+
+    def reconcile_rows(self, model, prefix, existing, dry_run):
+        rows = set(model.objects.filter(file__startswith=prefix).values_list('file', flat=True))
+        missing_rows = list(rows - existing)
+        self.stdout.write('{}: {} rows without objects'.format(model._meta.label, len(missing_rows)))
+        if dry_run:
+            return
+
+        deleted_rows = 0
+        for i in range(0, len(missing_rows), 1000):
+            deleted_rows += model.objects.filter(file__in=missing_rows[i:i + 1000]).delete()[0]
+        self.stdout.write(self.style.SUCCESS('{}: deleted {} rows'.format(model._meta.label, deleted_rows)))
@@ -0,0 +1,28 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models.article import Article
+
+
+class Command(BaseCommand):
+    help = '预热/重建文章Markdown渲染缓存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='忽略已有缓存，全部重新渲染')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        cache = Article.md_cache()
+        if isinstance(cache, LocMemCache):
+            # 进程内缓存随命令退出而丢失，预热不会对web进程生效
+            raise CommandError('ARTICLE_MD_CACHE使用的是进程内的LocMemCache，请改用多进程共享的缓存后端')
+        rendered = skipped = 0
+        queryset = Article.objects.only('id', 'body').order_by('id')
+        for article in queryset.iterator(chunk_size=options['chunk_size']):
+            if not rebuild and cache.get(article.md_cache_key()) is not None:
+                skipped += 1
+                continue
+            article.cache_md()
+            rendered += 1
+        self.stdout.write(self.style.SUCCESS('rendered: {}, skipped: {}'.format(rendered, skipped)))
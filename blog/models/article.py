@@ -1,11 +1,48 @@
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Value, When
 from markdown import Markdown
 
 from blog.models.account import MSAccount
+from blog.models.file import MSFileBlob
+from common.helper import md5
 from common.models.base import BaseModel
+from common.models.files import delete_files
+from common.utils.images import submit_variants, variant_name
 
 
-class Tag(BaseModel):
+TAG_CLOUD_CACHE_KEY = 'article:tag_cloud'
+
+
+def invalidate_tag_cloud():
+    transaction.on_commit(lambda: cache.delete(TAG_CLOUD_CACHE_KEY))
+
+
+class ArticleCountMixin(models.Model):
+    """冗余的文章数，随文章的标签/分类变化在同一事务中增减，可用reconcile_article_counts命令校正"""
+
+    class Meta:
+        abstract = True
+
+    article_count = models.PositiveIntegerField('文章数', default=0)
+
+    @classmethod
+    def adjust_article_count(cls, ids, delta):
+        ids = [i for i in ids if i]
+        if not ids or not delta:
+            return
+        if delta < 0:
+            # 加列前已有的标签/分类从0开始计数，减到0为止，不让无符号列下溢；可用reconcile_article_counts校正
+            value = Case(When(article_count__gte=-delta, then=F('article_count') + delta), default=Value(0))
+        else:
+            value = F('article_count') + delta
+        cls.objects.filter(id__in=ids).update(article_count=value)
+        invalidate_tag_cloud()
+
+
+class Tag(ArticleCountMixin, BaseModel):
     """文章标签"""
     text = models.CharField(max_length=30)
 
@@ -17,7 +54,7 @@ class Tag(BaseModel):
         return self.text
 
 
-class Category(BaseModel):
+class Category(ArticleCountMixin, BaseModel):
     """文章分类"""
     title = models.CharField(max_length=100)
 
@@ -31,10 +68,87 @@ class Category(BaseModel):
 
 class Avatar(BaseModel):
     content = models.ImageField(upload_to='avatar/%Y%m%d')
+    # 已生成的缩略图 {key: 存储中的文件名}，上传后由后台进程池生成
+    variants = models.JSONField('缩略图', default=dict, blank=True)
 
     class Meta:
         db_table = "article_avatar"
 
+    def save(self, *args, **kwargs):
+        uploaded = self.content and not self.content._committed
+        generate = False
+        replaced = None
+        if uploaded:
+            if self.pk:
+                # 替换原图时，保存后释放旧图
+                replaced = Avatar.objects.filter(pk=self.pk).values_list('content', 'variants').first()
+            # 上传后self.content会换成按路径打开的新文件，保留上传的文件，生成缩略图时不必再从存储下载
+            upload = self.content.file
+            # 按内容去重，相同的图片引用已有对象，并沿用其缩略图
+            MSFileBlob.save_file(self.content)
+            if replaced and replaced[0] == self.content.name:
+                # 内容未变：抵消本次增加的引用，沿用原来的缩略图
+                MSFileBlob.release([replaced[0]])
+                self.variants = replaced[1] or self.shared_variants()
+                replaced = None
+            else:
+                self.variants = self.shared_variants()
+            generate = not self.variants
+        super().save(*args, **kwargs)
+        if replaced:
+            self.release_content(*replaced)
+        if generate:
+            upload.seek(0)
+            data = upload.read()
+            transaction.on_commit(lambda: self.generate_variants(data))
+
+    def delete(self, *args, **kwargs):
+        name, variants = self.content.name, self.variants
+        result = super().delete(*args, **kwargs)
+        self.release_content(name, variants)
+        return result
+
+    def release_content(self, name, variants):
+        names = MSFileBlob.release([name])
+        if names:
+            # 最后一个引用释放时，原图和缩略图一起删除
+            delete_files(self.content.storage, names + list((variants or {}).values()))
+
+    def shared_variants(self):
+        others = Avatar.objects.filter(content=self.content.name).exclude(pk=self.pk)
+        for variants in others.values_list('variants', flat=True):
+            if variants:
+                return variants
+        return {}
+
+    def generate_variants(self, data):
+        submit_variants(data, settings.AVATAR_VARIANTS, self._save_variants, settings.AVATAR_VARIANT_WORKERS)
+
+    def _save_variants(self, variants):
+        try:
+            storage = self.content.storage
+            names = {}
+            for key, data in variants.items():
+                content = ContentFile(data)
+                content.obs_headers = {'contentType': 'image/webp'}
+                names[key] = storage.save(variant_name(self.content.name, key), content)
+            # 原图在生成期间被替换时不回写
+            Avatar.objects.filter(pk=self.pk, content=self.content.name).update(variants=names)
+            self.variants = names
+        finally:
+            # 回调在图片回调线程池中执行，需要自己关闭数据库连接
+            connections.close_all()
+
+    def variant_urls(self):
+        urls = {key: self.content.storage.url(name) for key, name in (self.variants or {}).items()}
+        # 尚未生成的尺寸先用原图
+        for key in settings.AVATAR_VARIANTS:
+            urls.setdefault(key, self.content.url if self.content else None)
+        return urls
+
+
+_DEFERRED = object()
+
 
 class Article(BaseModel):
     """博客文章 model"""
@@ -78,7 +192,46 @@ class Article(BaseModel):
     def __str__(self):
         return self.title
 
-    def get_md(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的分类，保存时据此调整分类的文章数
+        instance._loaded_category_id = instance.__dict__.get('category_id', _DEFERRED)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        old_category_id = getattr(self, '_loaded_category_id', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_category_id is not _DEFERRED and (update_fields is None or 'category' in update_fields
+                                                     or 'category_id' in update_fields):
+                if old_category_id != self.category_id:
+                    Category.adjust_article_count([old_category_id], -1)
+                    Category.adjust_article_count([self.category_id], 1)
+                self._loaded_category_id = self.category_id
+        # 保存时预先渲染，读取时直接命中缓存
+        self.cache_md()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            tag_ids = list(Article2Tag.objects.filter(article=self).values_list('tag_id', flat=True))
+            category_id = self.category_id
+            result = super().delete(*args, **kwargs)
+            Tag.adjust_article_count(tag_ids, -1)
+            Category.adjust_article_count([category_id], -1)
+        return result
+
+    @staticmethod
+    def md_cache():
+        return caches[settings.ARTICLE_MD_CACHE]
+
+    def md_cache_key(self):
+        # 以正文的hash作为key的一部分，正文变化后旧的缓存不再被读取，但不会立即删除：
+        # 缓存不过期，只在条目数达到MAX_ENTRIES时被淘汰，FileBasedCache是随机淘汰而不是LRU
+        return 'article:md:{}:{}'.format(self.pk, md5(self.body))
+
+    def render_md(self):
         md = Markdown(
             extensions=[
                 'markdown.extensions.extra',
@@ -89,6 +242,17 @@ class Article(BaseModel):
         md_body = md.convert(self.body)
         return md_body, md.toc
 
+    def cache_md(self):
+        result = self.render_md()
+        self.md_cache().set(self.md_cache_key(), result, None)
+        return result
+
+    def get_md(self):
+        result = self.md_cache().get(self.md_cache_key())
+        if result is None:
+            result = self.cache_md()
+        return tuple(result)
+
 
 class Article2Tag(BaseModel):
 
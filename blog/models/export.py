@@ -0,0 +1,14 @@
+from django.db import models
+
+from blog.models.account import MSAccount
+from common.models.export import BaseExportJob
+
+
+class MSExportJob(BaseExportJob):
+    class Meta:
+        db_table = 'ms_export_job'
+        ordering = ['-created']
+        verbose_name = '导出任务'
+        verbose_name_plural = 'Misc - 导出任务'
+
+    user = models.ForeignKey(MSAccount, models.SET_NULL, blank=True, null=True, db_constraint=False)
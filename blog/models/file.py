@@ -0,0 +1,8 @@
+from common.models.files import BaseFileBlob
+
+
+class MSFileBlob(BaseFileBlob):
+    class Meta:
+        db_table = 'ms_file_blob'
+        verbose_name = '文件内容索引'
+        verbose_name_plural = 'Misc - 文件内容索引'
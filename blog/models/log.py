@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import close_old_connections, models
 from django_extensions.db.models import TimeStampedModel
 
 from blog.models.account import MSAccount
+from common.models.log import BaseApiLog, BaseApiLogDaily
+from common.utils.batch_writer import BatchWriter
+
 
 class MSAccountLoginLog(TimeStampedModel):
     class Meta:
@@ -18,3 +21,34 @@ class MSAccountLoginLog(TimeStampedModel):
     def create_log(cls, user, ip, user_agent):
         return cls.objects.create(account=user, ip=ip, user_agent=user_agent)
 
+    @classmethod
+    def create_log_async(cls, user, ip, user_agent):
+        # created在实例化时就已确定，由后台线程批量写入
+        log = cls(account=user, ip=ip, user_agent=(user_agent or '')[:500])
+        return login_log_writer.put(log)
+
+
+def _write_login_logs(logs):
+    close_old_connections()
+    MSAccountLoginLog.objects.bulk_create(logs)
+
+
+login_log_writer = BatchWriter('login_log', _write_login_logs)
+
+
+class MSApiLogDaily(BaseApiLogDaily):
+    class Meta(BaseApiLogDaily.Meta):
+        db_table = 'ms_api_log_daily'
+        verbose_name = '接口耗时统计'
+        verbose_name_plural = 'Misc - 接口耗时统计'
+
+
+class MSApiLog(BaseApiLog):
+    class Meta:
+        db_table = 'ms_api_log'
+        verbose_name = '接口日志'
+        verbose_name_plural = 'Misc - 接口日志'
+
+    rollup_model = MSApiLogDaily
+
+    user = models.ForeignKey(MSAccount, models.SET_NULL, blank=True, null=True, db_constraint=False)
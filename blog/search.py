@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from blog.models.article import Article, Tag, Category, Article2Tag
+from common.search import SearchIndex, highlight
+
+article_index = SearchIndex(settings.ARTICLE_SEARCH_INDEX_PATH, 'article_fts', [
+    ('title', 10.0),
+    ('tags', 5.0),
+    ('category', 3.0),
+    ('body', 1.0),
+])
+
+
+def article_document(article):
+    return {
+        'title': article.title,
+        'body': article.body,
+        'tags': ' '.join(tag.text for tag in article.tags.all()),
+        'category': article.category.title if article.category else '',
+    }
+
+
+def index_articles(article_ids):
+    articles = Article.objects.filter(id__in=article_ids).select_related('category').prefetch_related('tags')
+    found = {article.id: article for article in articles}
+    article_index.index_many((pk, article_document(article)) for pk, article in found.items())
+    for pk in set(article_ids) - set(found):
+        article_index.remove(pk)
+
+
+def search_articles(keyword, limit=10, offset=0, snippet_length=120):
+    results = article_index.search(keyword, limit=limit, offset=offset)
+    return [{
+        'id': r['id'],
+        'score': r['score'],
+        'title': r['title'],
+        'title_highlight': highlight(r['title'], keyword),
+        'snippet': highlight(r['body'], keyword, length=snippet_length),
+        'tags': r['tags'].split() if r['tags'] else [],
+        'category': r['category'],
+    } for r in results]
+
+
+def _index_on_commit(article_ids):
+    # 事务提交后再建索引，保证能读到同一事务中写入的标签等关联数据
+    article_ids = list(article_ids)
+    if article_ids:
+        transaction.on_commit(lambda: index_articles(article_ids))
+
+
+@receiver(post_save, sender=Article, dispatch_uid='search_index_article')
+def _article_saved(sender, instance, **kwargs):
+    _index_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Article, dispatch_uid='search_remove_article')
+def _article_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: article_index.remove(pk))
+
+
+@receiver(post_save, sender=Article2Tag, dispatch_uid='search_index_article_tag')
+@receiver(post_delete, sender=Article2Tag, dispatch_uid='search_index_article_untag')
+def _article_tag_changed(sender, instance, **kwargs):
+    _index_on_commit([instance.article_id])
+
+
+@receiver(post_save, sender=Tag, dispatch_uid='search_index_tag')
+def _tag_saved(sender, instance, created, **kwargs):
+    if not created:
+        _index_on_commit(Article2Tag.objects.filter(tag=instance).values_list('article_id', flat=True))
+
+
+@receiver(post_save, sender=Category, dispatch_uid='search_index_category')
+def _category_saved(sender, instance, created, **kwargs):
+    if not created:
+        _index_on_commit(instance.articles.values_list('id', flat=True))
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
 from django.db.transaction import atomic
+from django.utils.module_loading import import_string
 from rest_framework import serializers
 
 from blog.serializers.base import BaseModelSerializer
@@ -7,8 +9,13 @@ from common.models.constants import ENABLE_STATUS
 from common.serializers.base import BaseSerializer, ChoiceSerializer
 from blog.models.account import MSAccount
 from blog.models.log import MSAccountLoginLog
+from common.utils.rate_limit import SlidingWindowLimiter
 from common.validators import UsernameValidator, PhoneNumberValidator, PasswordValidator
 
+_login_rate_limit_backend = import_string(settings.LOGIN_RATE_LIMIT_BACKEND)()
+login_username_limiter = SlidingWindowLimiter(*settings.LOGIN_RATE_LIMIT_USERNAME, backend=_login_rate_limit_backend)
+login_ip_limiter = SlidingWindowLimiter(*settings.LOGIN_RATE_LIMIT_IP, backend=_login_rate_limit_backend)
+
 
 class AccountSerializer(BaseModelSerializer):
     class Meta:
@@ -57,6 +64,13 @@ class AccountLoginSerializer(BaseSerializer):
 
     def validate(self, attrs):
         validated_data = super().validate(attrs)
+        request = self.context['request']
+        ip = request.META.get('REMOTE_ADDR')
+        username_key = 'login:user:{}'.format(validated_data['username'])
+        # 在查库和计算密码hash之前限流，撞库时不会让工作线程都耗在hash上
+        if not login_ip_limiter.allow('login:ip:{}'.format(ip)) or not login_username_limiter.allow(username_key):
+            raise serializers.ValidationError('登录尝试过于频繁，请稍后再试')
+
         account = MSAccount.objects.filter(username=validated_data['username']).first()
         if not account:
             raise serializers.ValidationError({'username': '账号不存在'})
@@ -67,9 +81,8 @@ class AccountLoginSerializer(BaseSerializer):
         if account.status != ENABLE_STATUS.ENABLED:
             raise serializers.ValidationError('账号已被禁用，请联系管理员')
 
-        request = self.context['request']
-        MSAccountLoginLog.create_log(account, ip=request.META['REMOTE_ADDR'],
-                                     user_agent=request.META['HTTP_USER_AGENT'])
+        login_username_limiter.reset(username_key)
+        MSAccountLoginLog.create_log_async(account, ip=ip, user_agent=request.META.get('HTTP_USER_AGENT'))
         self.account = account
         return validated_data
 
@@ -25,6 +25,7 @@ class TagSerializer(BaseModelSerializer):
     class Meta:
         model = Tag
         exclude = ['modified', 'created']
+        read_only_fields = ['article_count']
 
 
 class CategorySerializer(BaseModelSerializer):
@@ -33,16 +34,20 @@ class CategorySerializer(BaseModelSerializer):
     class Meta:
         model = Category
         exclude = ['modified', 'created']
-        read_only_fields = ['created']
+        read_only_fields = ['created', 'article_count']
 
 
 class AvatarSerializer(BaseModelSerializer):
     # url = serializers.HyperlinkedIdentityField(view_name='avatar-detail')
+    variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Avatar
         exclude = ['modified', 'created']
 
+    def get_variants(self, instance):
+        return instance.variant_urls()
+
 
 class _ArticleSerializer(BaseModelSerializer):
     tags = serializers.SerializerMethodField()
@@ -57,9 +62,8 @@ class _ArticleSerializer(BaseModelSerializer):
         exclude = ['modified', 'created']
 
     def get_tags(self, instance):
-        article_relations = Article2Tag.objects.filter(article=instance).prefetch_related("article", "tag")
-        tags = [relation.tag for relation in article_relations]
-        return TagSerializer(tags, many=True, only_fields=['id', 'text']).data
+        # 列表/详情的queryset已prefetch_related('tags')，这里不会再逐条查询
+        return TagSerializer(instance.tags.all(), many=True, only_fields=['id', 'text']).data
 
 
 class ArticleSerializer(BaseModelSerializer):
@@ -86,16 +90,33 @@ class ArticleSerializer(BaseModelSerializer):
             raise serializers.ValidationError(f'id为{value}的图标不存在')
         return value
 
-    def handle_tags(self, instance, value):
-        create_list = []
+    def validate_tags(self, value):
+        tag_ids = set(value)
+        existing = set(Tag.objects.filter(id__in=tag_ids).values_list('id', flat=True))
         for tag_pk in value:
-            if not Tag.objects.filter(id=tag_pk).exists():
+            if tag_pk not in existing:
                 raise serializers.ValidationError(f'id为{tag_pk}的标签不存在')
-            create_list.append(Article2Tag(article=instance, tag_id=tag_pk))
-
-        Article2Tag.objects.filter(article=instance).delete()
+        return value
 
-        Article2Tag.objects.bulk_create(create_list)
+    def handle_tags(self, instance, value):
+        # 只增删有变化的关联，不动没变的行
+        new_tag_ids = set(value)
+        old_tag_ids = set(Article2Tag.objects.filter(article=instance).values_list('tag_id', flat=True))
+        removed = old_tag_ids - new_tag_ids
+        added = new_tag_ids - old_tag_ids
+
+        if removed:
+            Article2Tag.objects.filter(article=instance, tag_id__in=removed).delete()
+        if added:
+            # dict.fromkeys去重并保持提交的顺序
+            Article2Tag.objects.bulk_create([
+                Article2Tag(article=instance, tag_id=tag_pk) for tag_pk in dict.fromkeys(value) if tag_pk in added
+            ])
+
+        Tag.adjust_article_count(removed, -1)
+        Tag.adjust_article_count(added, 1)
+        # get_object时prefetch的tags已过期
+        getattr(instance, '_prefetched_objects_cache', {}).pop('tags', None)
 
     @atomic
     def create(self, validated_data):
@@ -107,3 +128,11 @@ class ArticleSerializer(BaseModelSerializer):
         instance.author = self.context['request'].user
         return instance
 
+    @atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        instance = super(ArticleSerializer, self).update(instance, validated_data)
+        if tags is not None:
+            self.handle_tags(instance, tags)
+        return instance
+
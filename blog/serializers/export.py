@@ -0,0 +1,16 @@
+from rest_framework import serializers
+
+from blog.models.export import MSExportJob
+from common.models.constants import EXPORT_JOB_STATUS
+from common.serializers.base import BaseModelSerializer, ChoiceSerializer
+
+
+class ExportJobSerializer(BaseModelSerializer):
+    class Meta:
+        model = MSExportJob
+        fields = ['id', 'job_id', 'status', 'file_name', 'rows_written', 'total_rows', 'progress', 'error',
+                  'created']
+
+    status = ChoiceSerializer(choice_class=EXPORT_JOB_STATUS)
+    progress = serializers.FloatField(read_only=True)
+    created = serializers.DateTimeField(read_only=True, format='%Y-%m-%d %H:%M:%S')
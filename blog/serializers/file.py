@@ -26,16 +26,15 @@ class BaseFileResourceSerializer(BaseModelSerializer):
 
     def validate(self, attrs):
         file = attrs['file']
-        file_type = FILE_TYPE.get_type(file)
+        header = FILE_TYPE.read_header(file)
+        file_type = FILE_TYPE.get_type(header)
         if file_type not in self.allowed_file_types:
             msg = '只支持 [{}] 类型的文件'.format(', '.join([FILE_TYPE.text(t) for t in self.allowed_file_types]))
             raise serializers.ValidationError({'file': msg})
-        file.seek(0)
         attrs['file_type'] = file_type
         attrs['filename'] = file.name
-        attrs['content_type'] = filetype.guess_mime(file) or file.content_type
+        attrs['content_type'] = filetype.guess_mime(header) or file.content_type
         attrs['size'] = file.size
-        file.seek(0)
         return super().validate(attrs)
 
     def to_representation(self, instance):
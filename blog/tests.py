@@ -1,3 +1,815 @@
-from django.test import TestCase
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.core.cache import cache, caches
+import base64
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from blog.bulk import ArticleImporter
+from blog.management.commands.reconcile_file_resources import Command as ReconcileCommand, parse_last_modified
+from blog.models.account import MSAccount
+from blog.models.article import Tag, Category, Avatar, Article, Article2Tag
+from blog.models.export import MSExportJob
+from blog.models.file import MSFileBlob
+from blog.models.log import MSApiLog, MSApiLogDaily
+from blog.search import article_index, search_articles
+from blog.views.article import ArticleView
+from blog.views.base import BaseExportExcelView
+from blog.serializers import account as account_serializers
+from common.db.router import use_read_db
+from common.models.constants import EXPORT_JOB_STATUS
+from common.utils import export_job
+from common.search import highlight, tokenize
+from common.views.pagination import CachedCountPaginator, CursorPaginator, InvalidCursor, check_count_cache, estimated_count
+from common.storage import HuaweiStorage
+from common.utils.fake_obs import FakeObsClient
+from common.utils.rate_limit import SlidingWindowLimiter, MemoryBackend
+
+
+class ArticleListQueryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='admin', nickname='admin', phone='13800000000',
+                                            password='-', salt='-', is_superuser=True)
+        category = Category.objects.create(title='c')
+        tags = [Tag.objects.create(text='t{}'.format(i)) for i in range(3)]
+        avatar = Avatar.objects.create(content='avatar/a.png')
+        for i in range(12):
+            article = Article.objects.create(author=cls.user, category=category, avatar=avatar,
+                                             title='a{}'.format(i), body='# {}'.format(i))
+            Article2Tag.objects.bulk_create([Article2Tag(article=article, tag=t) for t in tags])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_articles(self, size):
+        # 分页总数有缓存，每次都从相同的状态开始计数
+        caches[settings.PAGINATION_COUNT_CACHE].clear()
+        response = self.client.get('/blog/api/article', {'size': size})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(len(data['items']), size)
+        self.assertTrue(all(len(item['tags']) == 3 and item['avatar'] for item in data['items']))
+
+    def test_query_count_independent_of_page_size(self):
+        # 条件GET的聚合(分页直接使用其中的总数)、文章(join作者/分类/标题图)、标签prefetch
+        with self.assertNumQueries(3):
+            self.list_articles(2)
+        with self.assertNumQueries(3):
+            self.list_articles(10)
+
+
+
+class CursorArticleView(ArticleView):
+    enable_cursor_pagination = True
+    enable_conditional_get = False
+
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='cursor', nickname='cursor', phone='13800000008',
+                                            password='-', salt='-', is_superuser=True)
+        # 三组created相同的文章，组之间只差1微秒
+        base = datetime(2024, 1, 1, 12, 0, 0, 500000, tzinfo=dt_timezone.utc)
+        for i in range(8):
+            article = Article.objects.create(title='c{}'.format(i), body='b')
+            Article.objects.filter(pk=article.pk).update(created=base + timedelta(microseconds=i % 3))
+        cls.expected = list(Article.objects.order_by('-created', '-id').values_list('id', flat=True))
+
+    def ids(self, items):
+        return [a.id for a in items]
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Article.objects.all(), 3, ordering=['-created'])
+        self.assertEqual(paginator.ordering, ['-created', '-id'])
+        pages = []
+        cursor = None
+        while True:
+            items, next_cursor, prev_cursor = paginator.page(cursor)
+            self.assertEqual(prev_cursor is None, not pages)
+            pages.append((self.ids(items), prev_cursor))
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        self.assertEqual([i for ids, _ in pages for i in ids], self.expected)
+        self.assertEqual([len(ids) for ids, _ in pages], [3, 3, 2])
+
+        # 从最后一页沿着prev往回翻，每一页与向前翻时相同
+        prev_cursor = pages[-1][1]
+        for ids, _ in reversed(pages[:-1]):
+            self.assertTrue(paginator.decode_cursor(prev_cursor)[1])
+            items, next_cursor, prev_cursor = paginator.page(prev_cursor)
+            self.assertEqual(self.ids(items), ids)
+            self.assertIsNotNone(next_cursor)
+        self.assertIsNone(prev_cursor)
+
+    def test_ascending_prev_from_middle(self):
+        paginator = CursorPaginator(Article.objects.all(), 2, ordering=['created'])
+        expected = list(reversed(self.expected))
+        _, next_cursor, _ = paginator.page()
+        items, next_cursor, _ = paginator.page(next_cursor)
+        items, _, prev_cursor = paginator.page(next_cursor)
+        self.assertEqual(self.ids(items), expected[4:6])
+        items, next_cursor, prev_cursor = paginator.page(prev_cursor)
+        self.assertEqual(self.ids(items), expected[2:4])
+        self.assertEqual(self.ids(paginator.page(next_cursor)[0]), expected[4:6])
+
+    def test_encode_keeps_microseconds(self):
+        paginator = CursorPaginator(Article.objects.all(), 3, ordering=['-created'])
+        created = datetime(2024, 1, 1, 12, 0, 0, 500001, tzinfo=dt_timezone.utc)
+        values, reverse = paginator.decode_cursor(paginator.encode_cursor([created, 5], True))
+        self.assertEqual(values, ['2024-01-01T12:00:00.500001+00:00', 5])
+        self.assertTrue(reverse)
+        # 以同一毫秒内的某条数据为cursor，之后的数据不会被跳过或重复
+        article = Article.objects.get(pk=self.expected[3])
+        items = paginator.page(paginator.encode_cursor(paginator.values_of(article), False))[0]
+        self.assertEqual(self.ids(items), self.expected[4:7])
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(Article.objects.all(), 3, ordering=['-created'])
+        encode = lambda payload: base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        for cursor in ['!!!', '中文', base64.urlsafe_b64encode(b'\xff\xfe').decode(), encode([1, 2]),
+                       encode({'v': ['2024-01-01T12:00:00+00:00', 1]}),
+                       encode({'v': ['2024-01-01T12:00:00+00:00'], 'r': 0}),
+                       encode({'v': 'ab', 'r': 0}),
+                       encode({'v': ['not a date', 1], 'r': 0}),
+                       encode({'v': ['2024-01-01T12:00:00+00:00', 'x'], 'r': 0})]:
+            with self.assertRaises(InvalidCursor, msg=cursor):
+                paginator.page(cursor)
+
+    def test_api_invalid_cursor(self):
+        def get(cursor):
+            request = APIRequestFactory().get('/blog/api/article', {'size': 3, 'cursor': cursor})
+            force_authenticate(request, self.user)
+            return CursorArticleView.as_view()(request).data
+        data = get('')['data']
+        self.assertEqual([item['id'] for item in data['items']], self.expected[:3])
+        self.assertEqual([item['id'] for item in get(data['next'])['data']['items']], self.expected[3:6])
+        resp = get(data['next'][:-4] + 'AAAA')
+        self.assertEqual((resp['code'], resp['msg']), (400, '无效的cursor'))
+
+class TokenCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='u', nickname='u', phone='13800000001',
+                                            password='-', salt='-')
+
+    def setUp(self):
+        caches[settings.USER_TOKEN_VERSION_CACHE].clear()
+        self.token = self.user.issue_token()
+        # 首次校验查询用户并缓存快照
+        self.assertEqual(MSAccount.get_user_by_token(self.token), self.user)
+
+    def test_cached_token_skips_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(MSAccount.get_user_by_token(self.token), self.user)
+
+    def test_save_invalidates_cached_snapshot(self):
+        MSAccount.objects.filter(pk=self.user.pk).update(nickname='changed')
+        self.user.nickname = 'changed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(MSAccount.get_user_by_token(self.token).nickname, 'changed')
+
+    def test_evicted_version_does_not_revalidate_snapshot(self):
+        caches[settings.USER_TOKEN_VERSION_CACHE].delete(MSAccount.token_version_key(self.user.pk))
+        with self.assertNumQueries(1):
+            MSAccount.get_user_by_token(self.token)
+
+
+class LoginRateLimitTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount(username='login', nickname='login', phone='13800000002')
+        cls.user.reset_password('right-password')
+        cls.user.save()
+
+    def login(self, password):
+        request = RequestFactory().post('/blog/api/account/login', REMOTE_ADDR='10.0.0.1')
+        serializer = account_serializers.AccountLoginSerializer(
+            data={'username': 'login', 'password': password}, context={'request': request})
+        return serializer.is_valid(), serializer.errors
+
+    def test_rejected_before_lookup_and_password_check(self):
+        limiter = SlidingWindowLimiter(2, 60, MemoryBackend())
+        with mock.patch.object(account_serializers, 'login_username_limiter', limiter), \
+                mock.patch.object(account_serializers, 'login_ip_limiter', SlidingWindowLimiter(100, 60)), \
+                mock.patch.object(account_serializers, 'check_password', return_value=False) as check:
+            self.assertFalse(self.login('wrong')[0])
+            self.assertFalse(self.login('wrong')[0])
+            self.assertEqual(check.call_count, 2)
+            with self.assertNumQueries(0):
+                valid, errors = self.login('right-password')
+            self.assertFalse(valid)
+            self.assertIn('过于频繁', str(errors))
+            self.assertEqual(check.call_count, 2)
+
+
+@override_settings(DATABASE_READ_REPLICAS=['replica'])
+class ReadReplicaTest(TestCase):
+    """default和replica是两个独立的SQLite库，按读到的数据判断查询走了哪个库"""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='rw', nickname='rw', phone='13800000003',
+                                            password='-', salt='-', is_superuser=True)
+        cls.primary = Article.objects.create(title='primary', body='p')
+        cls.replica = Article.objects.using('replica').create(title='replica', body='r')
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.PAGINATION_COUNT_CACHE].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def titles(self):
+        response = self.client.get('/blog/api/article')
+        return [item['title'] for item in response.json()['data']['items']]
+
+    def test_router(self):
+        self.assertEqual(list(Article.objects.values_list('title', flat=True)), ['primary'])
+        with use_read_db('replica'):
+            self.assertEqual(list(Article.objects.values_list('title', flat=True)), ['replica'])
+            # 写入始终走default
+            Tag.objects.create(text='w')
+        self.assertTrue(Tag.objects.filter(text='w').exists())
+        self.assertFalse(Tag.objects.using('replica').exists())
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.titles(), ['replica'])
+        extra = Article.objects.create(title='extra', body='e')
+        response = self.client.delete('/blog/api/article/{}'.format(extra.pk))
+        self.assertEqual(response.status_code, 200)
+        # 写入后的一段时间内，同一用户的读请求走主库
+        self.assertEqual(self.titles(), ['primary'])
+
+
+class ArticleCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='counter', nickname='counter', phone='13800000006',
+                                            password='-', salt='-', is_superuser=True)
+        cls.c1, cls.c2 = Category.objects.create(title='c1'), Category.objects.create(title='c2')
+        cls.t1, cls.t2, cls.t3 = [Tag.objects.create(text='t{}'.format(i)) for i in range(3)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        return ([Category.objects.get(pk=c.pk).article_count for c in (self.c1, self.c2)],
+                [Tag.objects.get(pk=t.pk).article_count for t in (self.t1, self.t2, self.t3)])
+
+    def create(self):
+        response = self.client.post('/blog/api/article', {
+            'title': 'a', 'body': 'b', 'category_id': self.c1.pk, 'tags': [self.t1.pk, self.t2.pk],
+        }, format='json')
+        self.assertEqual(response.json()['code'], 0)
+        return response.json()['data']['item']['id']
+
+    def test_create_update_delete(self):
+        pk = self.create()
+        self.assertEqual(self.counts(), ([1, 0], [1, 1, 0]))
+        response = self.client.put('/blog/api/article/{}'.format(pk), {
+            'category_id': self.c2.pk, 'tags': [self.t2.pk, self.t3.pk],
+        }, format='json')
+        self.assertEqual(response.json()['code'], 0)
+        self.assertEqual(self.counts(), ([0, 1], [0, 1, 1]))
+        self.assertEqual(self.client.delete('/blog/api/article/{}'.format(pk)).json()['code'], 0)
+        self.assertEqual(self.counts(), ([0, 0], [0, 0, 0]))
+
+    def test_counts_not_below_zero(self):
+        # 加列前已有的文章：标签和分类的计数从0开始，删除和去掉标签时不能减成负数
+        pk = self.create()
+        other = self.create()
+        Tag.objects.update(article_count=0)
+        Category.objects.update(article_count=0)
+        response = self.client.put('/blog/api/article/{}'.format(pk), {'tags': [self.t2.pk]}, format='json')
+        self.assertEqual(response.json()['code'], 0)
+        self.assertEqual(self.client.delete('/blog/api/article/{}'.format(other)).json()['code'], 0)
+        self.assertEqual(self.counts(), ([0, 0], [0, 0, 0]))
+
+
+class ArticleTagUpdateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='tagger', nickname='tagger', phone='13800000009',
+                                            password='-', salt='-', is_superuser=True)
+        cls.tags = [Tag.objects.create(text='t{}'.format(i)) for i in range(4)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/blog/api/article', {
+            'title': 'a', 'body': 'b', 'tags': [t.pk for t in self.tags[:3]],
+        }, format='json')
+        self.assertEqual(response.json()['code'], 0)
+        self.pk = response.json()['data']['item']['id']
+
+    def relations(self):
+        return dict(Article2Tag.objects.filter(article_id=self.pk).values_list('tag_id', 'pk'))
+
+    def put(self, data):
+        response = self.client.put('/blog/api/article/{}'.format(self.pk), data, format='json')
+        self.assertEqual(response.json()['code'], 0)
+        return response.json()['data']['item']
+
+    def test_unchanged_relations_kept(self):
+        t0, t1, t2, t3 = [t.pk for t in self.tags]
+        before = self.relations()
+        with CaptureQueriesContext(connection) as ctx:
+            item = self.put({'tags': [t1, t2, t3]})
+        after = self.relations()
+        self.assertEqual(set(after), {t1, t2, t3})
+        self.assertEqual((after[t1], after[t2]), (before[t1], before[t2]))
+        self.assertEqual(sorted(t['id'] for t in item['tags']), [t1, t2, t3])
+
+        # 关联表只有一次删除(去掉的t0)和一次插入(新增的t3)
+        writes = [q['sql'] for q in ctx.captured_queries
+                  if 'article_2_tag' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 2, writes)
+        self.assertTrue(writes[0].startswith('DELETE') and writes[1].startswith('INSERT'), writes)
+
+    def test_same_tags_no_writes(self):
+        before = self.relations()
+        with CaptureQueriesContext(connection) as ctx:
+            self.put({'tags': [t.pk for t in reversed(self.tags[:3])]})
+        self.assertEqual(self.relations(), before)
+        self.assertFalse([q for q in ctx.captured_queries
+                          if 'article_2_tag' in q['sql'] and not q['sql'].startswith('SELECT')])
+        self.assertEqual([Tag.objects.get(pk=t.pk).article_count for t in self.tags], [1, 1, 1, 0])
+
+    def test_put_without_tags(self):
+        before = self.relations()
+        item = self.put({'title': 'new'})
+        self.assertEqual(item['title'], 'new')
+        self.assertEqual(self.relations(), before)
+        self.assertEqual(len(item['tags']), 3)
+
+    def test_invalid_tag(self):
+        before = self.relations()
+        response = self.client.put('/blog/api/article/{}'.format(self.pk), {'tags': [self.tags[0].pk, 99999]},
+                                   format='json')
+        self.assertEqual(response.json()['code'], 400)
+        self.assertEqual(self.relations(), before)
+
+
+class ApiLogRollupTest(TestCase):
+    def write_logs(self, n):
+        # 与write_api_logs一致：写入日志的同时实时汇总
+        logs = MSApiLog.objects.bulk_create([
+            MSApiLog(route='blog/api/article', method='GET', spent=10 * (i + 1), resp_status=200) for i in range(n)
+        ])
+        MSApiLogDaily.rollup(logs)
+
+    def backfill(self, *args):
+        call_command('backfill_api_log_rollup', *args, stdout=StringIO())
+        return list(MSApiLogDaily.objects.values_list('date', 'count'))
+
+    def test_backfill_rebuilds_instead_of_merging(self):
+        self.write_logs(3)
+        yesterday = date.today() - timedelta(days=1)
+        MSApiLog.objects.update(date=yesterday)
+        MSApiLogDaily.objects.update(date=yesterday)
+        self.assertEqual(self.backfill(), [(yesterday, 3)])
+        self.assertEqual(self.backfill(), [(yesterday, 3)])
+        summary = MSApiLogDaily.objects.get()
+        self.assertEqual((summary.total_spent, summary.max_spent), (60, 30))
+
+    def test_backfill_skips_today_by_default(self):
+        self.write_logs(2)
+        self.assertEqual(self.backfill(), [(date.today(), 2)])
+        self.assertEqual(self.backfill('--until', date.today().isoformat()), [(date.today(), 2)])
+
+
+class ArticleSearchTest(TestCase):
+    def setUp(self):
+        article_index.clear()
+        self.addCleanup(article_index.clear)
+
+    def create(self, title, body, tags=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(title=title, body=body)
+            for tag in tags:
+                Article2Tag.objects.create(article=article, tag=tag)
+        return article
+
+    def ids(self, keyword):
+        return [r['id'] for r in search_articles(keyword)]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('学习中文 Hello, 世'), ['学习', '习中', '中文', '文', 'hello', '世'])
+        self.assertEqual(tokenize('学习中文', query=True), ['学习', '习中', '中文'])
+
+    def test_single_character_and_phrase(self):
+        a = self.create('中文', 'x')
+        b = self.create('hello', '学习中文字')
+        self.assertEqual(set(self.ids('中')), {a.pk, b.pk})
+        self.assertEqual(set(self.ids('文')), {a.pk, b.pk})
+        self.assertEqual(self.ids('字'), [b.pk])
+        self.assertEqual(self.ids('文字'), [b.pk])
+        self.assertEqual(self.ids('中字'), [])
+        self.assertEqual(self.ids('hello 中'), [b.pk])
+
+    def test_bm25_prefers_title(self):
+        in_body = self.create('其他', '这里讲缓存的用法')
+        in_title = self.create('缓存', '正文')
+        self.assertEqual(self.ids('缓存'), [in_title.pk, in_body.pk])
+
+    def test_highlight(self):
+        self.assertEqual(highlight('<b>Redis</b> 缓存', 'redis 缓存'), '&lt;b&gt;<em>Redis</em>&lt;/b&gt; <em>缓存</em>')
+        snippet = highlight('a' * 100 + '缓存' + 'b' * 100, '缓存', length=20)
+        self.assertTrue(snippet.startswith('…') and snippet.endswith('…'))
+        self.assertIn('<em>缓存</em>', snippet)
+        article = self.create('Redis缓存', '正文提到缓存')
+        result, = search_articles('缓存')
+        self.assertEqual(result['id'], article.pk)
+        self.assertEqual(result['title_highlight'], 'Redis<em>缓存</em>')
+        self.assertEqual(result['snippet'], '正文提到<em>缓存</em>')
+
+    def test_index_follows_signals(self):
+        tag = Tag.objects.create(text='数据库')
+        article = self.create('标题', '正文', tags=[tag])
+        self.assertEqual(self.ids('数据库'), [article.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.text = '存储'
+            tag.save()
+        self.assertEqual(self.ids('数据库'), [])
+        self.assertEqual(self.ids('存储'), [article.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            article.delete()
+        self.assertEqual(self.ids('标题'), [])
+
+
+class CachedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Article.objects.bulk_create([Article(title='a{}'.format(i), body='b') for i in range(5)])
+
+    def setUp(self):
+        caches[settings.PAGINATION_COUNT_CACHE].clear()
+
+    def count(self, queryset):
+        return CachedCountPaginator(queryset, 2, cache_timeout=30).count
+
+    def test_count_cached_until_write(self):
+        queryset = Article.objects.all()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(queryset), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(queryset), 5)
+        # 不同的过滤条件分别缓存
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(queryset.filter(title='a1')), 1)
+        # 写入后版本号变化，所有进程共享的缓存中的旧总数不再命中
+        version = caches[settings.PAGINATION_COUNT_CACHE].get('count:ver:blog.Article')
+        Article.objects.create(title='new', body='b')
+        self.assertNotEqual(caches[settings.PAGINATION_COUNT_CACHE].get('count:ver:blog.Article'), version)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(queryset), 6)
+        Article.objects.filter(title='new').first().delete()
+        self.assertEqual(self.count(queryset), 5)
+
+    def test_empty_result_and_no_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(Article.objects.filter(id__in=[])), 0)
+        with self.assertNumQueries(2):
+            paginator = CachedCountPaginator(Article.objects.all(), 2)
+            self.assertEqual(paginator.count, 5)
+            self.assertEqual(CachedCountPaginator(Article.objects.all(), 2).count, 5)
+
+    def test_estimated_count(self):
+        # 只在MySQL无过滤条件时使用表统计信息，其他情况返回None并回退到COUNT
+        self.assertIsNone(estimated_count(Article.objects.filter(title='a1')))
+        self.assertIsNone(estimated_count(Article.objects.all()))
+        self.assertEqual(CachedCountPaginator(Article.objects.all(), 2, estimate=True).count, 5)
+
+    def test_check_warns_on_locmem(self):
+        self.assertEqual([w.id for w in check_count_cache(None)], ['common.W002'])
+        with override_settings(PAGINATION_COUNT_CACHE='markdown', CACHES={
+            **settings.CACHES, 'markdown': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }):
+            self.assertEqual(check_count_cache(None), [])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MSAccount.objects.create(username='cg', nickname='cg', phone='13800000004',
+                                            password='-', salt='-', is_superuser=True)
+        cls.article = Article.objects.create(title='a', body='b')
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.PAGINATION_COUNT_CACHE].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_conditional_queries(self):
+        etag = self.client.get('/blog/api/article')['ETag']
+        # 最后修改时间和总数一次查出，命中时不再查询文章
+        with self.assertNumQueries(1):
+            response = self.client.get('/blog/api/article', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # 分页直接使用条件GET查到的总数
+        caches[settings.PAGINATION_COUNT_CACHE].clear()
+        with self.assertNumQueries(3):
+            self.client.get('/blog/api/article')
+
+    def test_list_etag_ignores_stale_cached_count(self):
+        older = Article.objects.create(title='older', body='b')
+        Article.objects.filter(pk=older.pk).update(modified=self.article.modified - timedelta(days=1))
+        etag = self.client.get('/blog/api/article')['ETag']
+        # 其他进程删除了非最新的文章：本进程缓存的总数没有失效，最后修改时间也没变
+        Article.objects.filter(pk=older.pk)._raw_delete('default')
+        response = self.client.get('/blog/api/article', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['total_count'], 1)
+
+    def test_etag_changes_within_same_second(self):
+        etag = self.client.get('/blog/api/article/{}'.format(self.article.pk))['ETag']
+        Article.objects.filter(pk=self.article.pk).update(modified=self.article.modified + timedelta(microseconds=1))
+        response = self.client.get('/blog/api/article/{}'.format(self.article.pk), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_pk_is_not_found(self):
+        response = self.client.get('/blog/api/article/abc')
+        self.assertEqual(response.json()['code'], 404)
+
+
+class ArticleImportTest(TestCase):
+    def rows(self, n, prefix):
+        return [(i, {'title': '{}{}'.format(prefix, i), 'body': 'b', 'category': 'c{}'.format(i % 2),
+                     'tags': ['x', 'y{}'.format(i % 3)]}, None) for i in range(n)]
+
+    def test_bulk_import(self):
+        # Django 3.2的SQLite与MySQL一样不回填bulk_create的主键，走读回主键的分支
+        self.assertFalse(connection.features.can_return_rows_from_bulk_insert)
+        # 先建好全部分类和标签，两次导入的区别只有文章数
+        ArticleImporter().run(self.rows(3, 'warm'))
+        with CaptureQueriesContext(connection) as small:
+            report = ArticleImporter().run(self.rows(3, 's'))
+        self.assertEqual(report, {'created': 3, 'errors': []})
+        with CaptureQueriesContext(connection) as large:
+            report = ArticleImporter().run(self.rows(30, 'l'))
+        self.assertEqual(report['created'], 30)
+        # 查询数只与分类/标签的种类数有关，与文章数无关
+        self.assertEqual(len(small), len(large))
+
+        self.assertEqual(Article.objects.count(), 36)
+        article = Article.objects.get(title='l4')
+        self.assertEqual(article.category.title, 'c0')
+        self.assertEqual(sorted(t.text for t in article.tags.all()), ['x', 'y1'])
+        self.assertEqual(Tag.objects.get(text='x').article_count, 36)
+        self.assertEqual(Category.objects.get(title='c0').article_count,
+                         Article.objects.filter(category__title='c0').count())
+
+    def test_multipart_without_file(self):
+        user = MSAccount.objects.create(username='imp', nickname='imp', phone='13800000005',
+                                        password='-', salt='-', is_superuser=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/blog/api/article/bulk', {'other': 'x'}, format='multipart')
+        self.assertEqual(response.json()['code'], 400)
+
+
+class ReconcileFileResourcesTest(TestCase):
+    def test_parse_last_modified(self):
+        expected = datetime(2021, 3, 4, 5, 6, 7, tzinfo=dt_timezone.utc)
+        local = expected.astimezone().strftime('%Y/%m/%d %H:%M:%S')
+        self.assertEqual(parse_last_modified(local), expected)
+        self.assertEqual(parse_last_modified('2021-03-04T05:06:07'), expected)
+        self.assertEqual(parse_last_modified('2021-03-04T13:06:07+08:00'), expected)
+        self.assertIsNone(parse_last_modified(''))
+        self.assertIsNone(parse_last_modified('bad'))
+
+    def test_keep_objects_referenced_by_any_model(self):
+        Avatar.objects.create(content='blog/file/avatar.png', variants={'s': 'blog/file/avatar.s.webp'})
+        MSFileBlob.objects.create(sha256='0' * 64, name='blog/file/blob', size=1, ref_count=1)
+        MSExportJob.objects.create(file_name='export.csv', file='blog/file/export.csv')
+        client = FakeObsClient()
+        storage = HuaweiStorage({'AccessKey': 'ak', 'SecretKey': 'sk', 'Server': 'obs.local',
+                                 'URL': 'https://obs.local', 'Bucket': 'test'}, client=client)
+        old = datetime.now(dt_timezone.utc) - timedelta(days=2)
+        for name in ['avatar.png', 'avatar.s.webp', 'blob', 'export.csv', 'orphan', 'new-orphan']:
+            client._store('blog/file/' + name, b'x', {})
+            if name != 'new-orphan':
+                client.objects['blog/file/' + name]['last_modified'] = old
+
+        command = ReconcileCommand(stdout=StringIO(), stderr=StringIO())
+        deadline = datetime.now(dt_timezone.utc) - timedelta(hours=24)
+        existing = command.reconcile_objects(storage, 'blog/file/', command.referenced_names(), deadline, False)
+        self.assertEqual(len(existing), 6)
+        self.assertEqual(sorted(client.objects), [
+            'blog/file/avatar.png', 'blog/file/avatar.s.webp', 'blog/file/blob', 'blog/file/export.csv',
+            'blog/file/new-orphan',
+        ])
+
+
+def png(color):
+    buf = BytesIO()
+    Image.new('RGB', (4, 4), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class AvatarUploadTest(TestCase):
+    def setUp(self):
+        self.storage = HuaweiStorage({'AccessKey': 'ak', 'SecretKey': 'sk', 'Server': 'obs.local',
+                                      'URL': 'https://obs.local', 'Bucket': 'test'}, client=FakeObsClient())
+        self.objects = self.storage.client.objects
+        for patcher in [mock.patch.object(Avatar._meta.get_field('content'), 'storage', self.storage),
+                        mock.patch.object(Avatar, 'generate_variants')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, avatar, data):
+        avatar.content = SimpleUploadedFile('a.png', data)
+        with self.captureOnCommitCallbacks(execute=True):
+            avatar.save()
+        return avatar
+
+    def with_variants(self, avatar):
+        # 模拟已生成缩略图
+        name = avatar.content.name + '.s.webp'
+        self.storage.client._store(name, b'webp', {})
+        avatar.variants = {'s': name}
+        Avatar.objects.filter(pk=avatar.pk).update(variants=avatar.variants)
+        return name
+
+    def test_variants_generated_from_uploaded_bytes(self):
+        data = png('red')
+        avatar = self.upload(Avatar(), data)
+        # 上传后仍从上传的文件读取原图生成缩略图，不再从存储下载
+        Avatar.generate_variants.assert_called_once_with(data)
+        self.assertFalse(self.storage.client.calls_of('getObject'))
+        self.assertEqual(self.objects[avatar.content.name]['data'], data)
+
+    def test_replace_releases_old_content(self):
+        avatar = self.upload(Avatar(), png('red'))
+        old_name = avatar.content.name
+        old_variant = self.with_variants(avatar)
+        self.upload(avatar, png('blue'))
+        self.assertNotIn(old_name, self.objects)
+        self.assertNotIn(old_variant, self.objects)
+        self.assertFalse(MSFileBlob.objects.filter(name=old_name).exists())
+        self.assertEqual(MSFileBlob.objects.get(name=avatar.content.name).ref_count, 1)
+
+    def test_replace_keeps_shared_content(self):
+        avatar = self.upload(Avatar(), png('red'))
+        old_name = avatar.content.name
+        old_variant = self.with_variants(avatar)
+        other = self.upload(Avatar(), png('red'))
+        self.assertEqual(other.content.name, old_name)
+        self.upload(avatar, png('blue'))
+        self.assertIn(old_name, self.objects)
+        self.assertIn(old_variant, self.objects)
+        self.assertEqual(MSFileBlob.objects.get(name=old_name).ref_count, 1)
+
+    def test_reupload_same_content(self):
+        avatar = self.upload(Avatar(), png('red'))
+        variant = self.with_variants(avatar)
+        self.upload(avatar, png('red'))
+        self.assertEqual(avatar.variants, {'s': variant})
+        self.assertIn(variant, self.objects)
+        self.assertEqual(MSFileBlob.objects.get(name=avatar.content.name).ref_count, 1)
+        self.assertEqual(Avatar.generate_variants.call_count, 1)
+
+    def test_dedup_respects_obs_headers(self):
+        def upload(filename):
+            content = SimpleUploadedFile('a.png', png('red'))
+            content.obs_headers = {'contentType': 'image/png',
+                                   'contentDisposition': 'attachment; filename="{}"'.format(filename)}
+            avatar = Avatar(content=content)
+            avatar.save()
+            return avatar.content.name
+
+        first = upload('mine.png')
+        # 下载文件名不同的上传不共用对象，不会拿到别人的文件名
+        other = upload('yours.png')
+        self.assertNotEqual(first, other)
+        self.assertEqual(self.objects[other]['headers']['extensionHeaders'],
+                         {'Content-Disposition': 'attachment; filename="yours.png"'})
+        self.assertEqual(upload('mine.png'), first)
+
+    def test_acquire_gives_up(self):
+        upload = mock.Mock(return_value='avatar/uploaded.png')
+        self.storage.client._store('avatar/uploaded.png', b'x', {})
+        with mock.patch.object(MSFileBlob.objects, 'create', side_effect=IntegrityError) as create:
+            with self.assertRaises(IntegrityError):
+                MSFileBlob.acquire('0' * 64, 1, upload, self.storage)
+        upload.assert_called_once_with()
+        self.assertEqual(create.call_count, MSFileBlob.ACQUIRE_ATTEMPTS)
+        self.assertNotIn('avatar/uploaded.png', self.objects)
+
+
+class ArticleExportView(BaseExportExcelView):
+    queryset = Article.objects.order_by('id')
+    file_name = 'articles'
+    sheets = ({'title': '文章', 'fields_map': (('标题', 'title'),)},)
+
+
+class ExportTestMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = MSAccount.objects.create(username='exp', nickname='exp', phone='13800000007',
+                                             password='-', salt='-', is_superuser=True)
+        Article.objects.bulk_create([Article(title='t{}'.format(i), body='b') for i in range(3)])
+
+    def export(self, **params):
+        request = APIRequestFactory().get('/export', {'export_format': 'csv', **params})
+        force_authenticate(request, self.user)
+        return ArticleExportView.as_view()(request)
+
+
+EXPORT_CSV = '\ufeff序号,标题\r\n1,t0\r\n2,t1\r\n3,t2\r\n'.encode('UTF-8')
+
+
+class ExportDownloadTest(ExportTestMixin, TestCase):
+    def test_streaming_download_by_default(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), EXPORT_CSV)
+        self.assertFalse(MSExportJob.objects.exists())
+
+    def test_ranged_download(self):
+        job = MSExportJob.objects.create(user=self.user, file_name='a.csv', status=EXPORT_JOB_STATUS.DONE)
+        job.file.save('a.csv', ContentFile(b'0123456789'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/blog/api/export/job/{}/file'.format(job.job_id)
+
+        response = client.get(url)
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        for header, content, content_range in [('bytes=2-5', b'2345', 'bytes 2-5/10'),
+                                               ('bytes=7-', b'789', 'bytes 7-9/10'),
+                                               ('bytes=-3', b'789', 'bytes 7-9/10'),
+                                               ('bytes=8-100', b'89', 'bytes 8-9/10')]:
+            response = client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(b''.join(response.streaming_content), content, header)
+            self.assertEqual(response['Content-Range'], content_range, header)
+        for header in ['bytes=10-', 'bytes=5-2']:
+            response = client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */10')
+
+        # 未完成的任务、其他用户的任务都不能下载
+        MSExportJob.objects.filter(pk=job.pk).update(status=EXPORT_JOB_STATUS.RUNNING)
+        self.assertEqual(client.get(url).json()['code'], 404)
+        MSExportJob.objects.filter(pk=job.pk).update(status=EXPORT_JOB_STATUS.DONE, user=None)
+        self.assertEqual(client.get(url).json()['code'], 404)
+
+
+class ExportJobTest(ExportTestMixin, TransactionTestCase):
+    # 任务在线程池中执行，需要真正提交的数据
+    def test_background_job(self):
+        futures = []
+
+        def submit(*args):
+            futures.append(export_job.get_executor().submit(export_job.run_export_job, *args))
+            return futures[-1]
+
+        with mock.patch.object(export_job, 'submit_export_job', side_effect=submit):
+            response = self.export(**{'async': '1'})
+        item = response.data['data']['item']
+        self.assertEqual(item['file_name'], 'articles.csv')
+        futures[0].result(timeout=30)
+
+        job = MSExportJob.objects.get(job_id=item['job_id'])
+        self.assertEqual(job.status, EXPORT_JOB_STATUS.DONE)
+        self.assertEqual((job.rows_written, job.total_rows, job.progress), (3, 3, 1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get('/blog/api/export/job/{}'.format(job.job_id)).json()['data']['item']
+        self.assertEqual((data['rows_written'], data['progress']), (3, 1))
+        response = client.get('/blog/api/export/job/{}/file'.format(job.job_id))
+        self.assertEqual(b''.join(response.streaming_content), EXPORT_CSV)
+
+    def test_failed_job(self):
+        with mock.patch.object(ArticleExportView, 'export', side_effect=RuntimeError('boom')):
+            job = MSExportJob.objects.create(user=self.user, file_name='a.csv')
+            view = ArticleExportView()
+            export_job.run_export_job(view, Article.objects.all(), job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, EXPORT_JOB_STATUS.FAILED)
+        self.assertIn('boom', job.error)
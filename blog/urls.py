@@ -1,7 +1,9 @@
 from django.urls import path
 
 from blog.views.account import LoginView, AccountManageView
-from blog.views.article import TagManageView, CategoryManageView, ArticleView, AvatarView
+from blog.views.article import TagManageView, CategoryManageView, ArticleView, AvatarView, TagCloudView, \
+    ArticleBulkView
+from blog.views.export import ExportJobView
 from blog.views.index import IndexView
 from common.helper import rest_urls
 
@@ -10,8 +12,12 @@ urlpatterns = [
     *rest_urls('account/manage', AccountManageView, actions=['reset_password']),
     path('index', IndexView.as_view()),
 
+    path('article/tag_cloud', TagCloudView.as_view()),
     *rest_urls('article/tag', TagManageView),
     *rest_urls('article/category', CategoryManageView),
     *rest_urls('article/avatar', AvatarView),
+    path('article/bulk', ArticleBulkView.as_view()),
     *rest_urls('article', ArticleView),
+
+    *rest_urls('export/job', ExportJobView, actions=['file']),
 ]
\ No newline at end of file
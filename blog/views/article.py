@@ -1,6 +1,11 @@
-from blog.models.article import Tag, Category, Article, Avatar
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+
+from blog.bulk import ArticleImporter, parse_ndjson, iter_articles_ndjson
+from blog.models.article import Tag, Category, Article, Avatar, TAG_CLOUD_CACHE_KEY
 from blog.serializers.article import TagSerializer, CategorySerializer, AvatarSerializer, ArticleSerializer
-from blog.views.base import SuperUserActionView, NoLoginRestfulView
+from blog.views.base import SuperUserActionView, NoLoginRestfulView, BaseAPIView
 
 
 class AvatarView(SuperUserActionView):
@@ -19,5 +24,54 @@ class CategoryManageView(NoLoginRestfulView):
 
 
 class ArticleView(SuperUserActionView):
-    queryset = Article.objects.all()
+    # author/category/avatar用join一次取出，tags批量prefetch，查询数不随分页大小增长
+    queryset = Article.objects.select_related('author', 'category', 'avatar').prefetch_related('tags')
     serializer_class = ArticleSerializer
+    use_read_replica = True
+    enable_conditional_get = True
+    # 需要登录的接口，只允许客户端缓存，每次使用前用ETag校验
+    cache_control = {'private': True, 'no_cache': True}
+
+
+class TagCloudView(BaseAPIView):
+    """标签云和分类列表，直接读取冗余的文章数，结果缓存到文章数变化为止"""
+    http_method_names = ['get']
+    permission_classes = []
+
+    def get(self, request):
+        data = cache.get(TAG_CLOUD_CACHE_KEY)
+        if data is None:
+            data = {
+                'tags': list(Tag.objects.filter(article_count__gt=0).order_by('-article_count', 'id')
+                             .values('id', 'text', 'article_count')),
+                'categories': list(Category.objects.order_by('-article_count', 'id')
+                                   .values('id', 'title', 'article_count')),
+            }
+            cache.set(TAG_CLOUD_CACHE_KEY, data, settings.TAG_CLOUD_CACHE_TIMEOUT)
+        return self.ok_resp(self.CODE_OK, data=data)
+
+
+class ArticleBulkView(SuperUserActionView):
+    """
+    GET: 以NDJSON流式导出全部文章
+    POST: 导入NDJSON，可以直接作为请求体，也可以作为multipart中名为file的文件上传
+    """
+    need_log_body = False
+    http_method_names = ['get', 'post']
+    queryset = Article.objects.all()
+
+    def get(self, request):
+        response = StreamingHttpResponse(iter_articles_ndjson(self.get_queryset()),
+                                         content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="articles.ndjson"'
+        return response
+
+    def post(self, request):
+        if request.content_type.startswith('multipart/'):
+            lines = request.FILES.get('file')
+            if lines is None:
+                return self.ok_resp(self.CODE_INVALID_PARAMS, msg='缺少名为file的NDJSON文件')
+        else:
+            lines = request._request
+        report = ArticleImporter(author=request.user).run(parse_ndjson(lines))
+        return self.ok_resp(self.CODE_OK, data=report)
@@ -8,12 +8,16 @@ from common.views import mixins
 from common.views.mixins import BaseRestfulMixin, BaseDownloadMixin, BaseExcelComposeMixin
 from common.views.views import LogApiView
 from blog.auth.authentication import UserTokenAuthentication
+from blog.models.export import MSExportJob
+from blog.models.log import MSApiLog
+from blog.serializers.export import ExportJobSerializer
 from blog.auth.permission import UserPermission, SuperUserPermission, ShopAccountReadPermission, \
     ShopAccountActionPermission
 
 
 class BaseAPIView(mixins.GeneralCodeMixin, mixins.BaseAPIViewMixin, LogApiView):
     authentication_classes = [UserTokenAuthentication]
+    api_log_model = MSApiLog
 
     def handle_exception(self, exc):
         if isinstance(exc, MethodNotAllowed):
@@ -68,8 +72,12 @@ class BaseDownloadView(BaseDownloadMixin, BaseRestfulView):
 
 
 class BaseExportExcelView(BaseExcelComposeMixin, BaseDownloadView):
+    # 默认直接下载，请求参数async=1或export_in_background = True时改为后台导出
+    export_job_model = MSExportJob
+    export_job_serializer_class = ExportJobSerializer
+
     def download(self, queryset):
-        return self.create_excel(queryset)
+        return self.export(queryset)
 
 
 class NoLoginRestfulView(BaseRestfulActionsView):
@@ -0,0 +1,28 @@
+from blog.models.export import MSExportJob
+from blog.serializers.export import ExportJobSerializer
+from blog.views.base import BaseRestfulActionsView
+from common.models.constants import EXPORT_JOB_STATUS
+from common.views.resp import ranged_file_response
+
+
+class ExportJobView(BaseRestfulActionsView):
+    """导出任务的进度查询与文件下载(支持Range断点续传)"""
+    http_method_names = ['get']
+    queryset = MSExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    lookup_field = 'job_id'
+    lookup_url_kwarg = 'pk'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def get(self, request, pk=None):
+        if self.action == 'file':
+            return self.download_file(request)
+        return super().get(request, pk)
+
+    def download_file(self, request):
+        job = self.get_object()
+        if not job or job.status != EXPORT_JOB_STATUS.DONE:
+            return self.ok_resp(self.CODE_RESOURCE_NOT_FOUND)
+        return ranged_file_response(request, job.file.open('rb'), job.file.size, job.file_name)
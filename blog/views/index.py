@@ -1,9 +1,29 @@
-from rest_framework.response import Response
-from rest_framework.views import APIView
+from blog.search import article_index, search_articles
+from blog.views.base import BaseAPIView
 
 
-class IndexView(APIView):
+class IndexView(BaseAPIView):
+    """文章全文检索"""
+    http_method_names = ['get']
+    permission_classes = []
+
+    default_page_size = 10
+    max_page_size = 50
 
     def get(self, request):
-        q = request.GET.get("keyword")
-        return Response({"info": q})
+        keyword = (request.GET.get('keyword') or '').strip()
+        try:
+            page = max(int(request.GET.get('page') or 1), 1)
+            size = min(max(int(request.GET.get('size') or self.default_page_size), 1), self.max_page_size)
+        except ValueError:
+            return self.ok_resp(self.CODE_INVALID_PARAMS, msg='page/size必须是数字')
+        if not keyword:
+            return self.ok_resp(self.CODE_OK, data={'items': [], 'page': page, 'page_size': size, 'total_count': 0})
+
+        items = search_articles(keyword, limit=size, offset=(page - 1) * size)
+        return self.ok_resp(self.CODE_OK, data={
+            'items': items,
+            'page': page,
+            'page_size': size,
+            'total_count': article_index.count(keyword),
+        })
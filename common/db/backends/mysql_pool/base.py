@@ -0,0 +1,116 @@
+"""
+带连接池的MySQL backend，ENGINE设置为 'common.db.backends.mysql_pool' 即可启用
+
+Django关闭连接(请求结束、close_old_connections)时把底层连接放回进程内的连接池，
+下次建立连接时优先复用，省去TCP握手和认证。可在DATABASES中通过POOL配置：
+    'POOL': {
+        'MAX_SIZE': 10,             # 池中最多保留的空闲连接数
+        'MAX_LIFETIME': 3600,       # 连接最长使用时间(秒)，超过后关闭重建
+        'HEALTH_CHECK_AFTER': 10,   # 空闲超过该秒数的连接在取出时先ping一次
+    }
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.backends.mysql import base as mysql_base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, max_lifetime=3600, health_check_after=10):
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        # (connection, 创建时间, 放回池中的时间)
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, connect):
+        while True:
+            with self.lock:
+                item = self.idle.pop() if self.idle else None
+            if item is None:
+                return connect(), time.monotonic()
+
+            connection, created_at, released_at = item
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime:
+                _close_quietly(connection)
+                continue
+            if now - released_at > self.health_check_after:
+                try:
+                    connection.ping()
+                except Exception:
+                    _close_quietly(connection)
+                    continue
+            return connection, created_at
+
+    def release(self, connection, created_at):
+        now = time.monotonic()
+        if now - created_at > self.max_lifetime:
+            _close_quietly(connection)
+            return
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append((connection, created_at, now))
+                return
+        _close_quietly(connection)
+
+    def clear(self):
+        with self.lock:
+            items, self.idle = list(self.idle), deque()
+        for connection, _, _ in items:
+            _close_quietly(connection)
+
+
+def get_pool(alias, options):
+    # fork出来的子进程不能复用父进程的socket，按pid区分
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    max_size=options.get('MAX_SIZE', 10),
+                    max_lifetime=options.get('MAX_LIFETIME', 3600),
+                    health_check_after=options.get('HEALTH_CHECK_AFTER', 10),
+                )
+    return pool
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    pool_created_at = None
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get('POOL') or {})
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        connection, self.pool_created_at = self.pool.acquire(connect)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.errors_occurred or self.in_atomic_block:
+            # 连接状态未知，直接关闭不放回池中
+            return super()._close()
+        with self.wrap_database_errors:
+            if not self.autocommit:
+                self.connection.rollback()
+        self.pool.release(self.connection, self.pool_created_at)
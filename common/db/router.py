@@ -0,0 +1,64 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+_read_db = ContextVar('read_db', default=None)
+
+
+@contextmanager
+def use_read_db(alias):
+    token = _read_db.set(alias)
+    try:
+        yield
+    finally:
+        _read_db.reset(token)
+
+
+def choose_read_replica():
+    replicas = settings.DATABASE_READ_REPLICAS
+    return random.choice(replicas) if replicas else None
+
+
+def _sticky_key(key):
+    return 'db:sticky:{}'.format(key)
+
+
+def mark_recent_write(key):
+    """key(一般是用户id)写入后的一小段时间内，读请求也走主库，保证能读到自己刚写入的数据"""
+    caches[settings.DATABASE_READ_STICKY_CACHE].set(_sticky_key(key), 1, settings.DATABASE_READ_STICKY_SECONDS)
+
+
+def is_sticky(key):
+    return caches[settings.DATABASE_READ_STICKY_CACHE].get(_sticky_key(key)) is not None
+
+
+@checks.register(checks.Tags.database, checks.Tags.caches)
+def check_sticky_cache(app_configs, **kwargs):
+    # 写入标记只存在写入的进程里时，同一用户的下一个读请求落到其他进程就会读到落后的副本
+    if settings.DATABASE_READ_REPLICAS and isinstance(caches[settings.DATABASE_READ_STICKY_CACHE], LocMemCache):
+        return [checks.Warning(
+            'DATABASE_READ_STICKY_CACHE使用的是进程内的LocMemCache，多进程部署时写后读可能读到副本的旧数据',
+            hint='配置了DATABASE_READ_REPLICAS时，把DATABASE_READ_STICKY_CACHE指向redis等多进程共享的cache',
+            id='common.W001',
+        )]
+    return []
+
+
+class ReadReplicaRouter:
+    """
+    写操作全部走default；读操作默认也走default，只有在use_read_db指定了只读副本的上下文中才走副本
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_db.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
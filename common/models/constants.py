@@ -32,6 +32,16 @@ class FILE_TYPE(BASE_CHOICE):
         (FONT, '字体'),
         (UNKNOWN, '不详'),
     ]
+    # 类型识别只需要文件头部的魔数，与filetype读取的字节数一致
+    HEADER_SIZE = 8192
+
+    @classmethod
+    def read_header(cls, file):
+        """只读取文件头部用于识别类型，读取后复位"""
+        file.seek(0)
+        header = file.read(cls.HEADER_SIZE)
+        file.seek(0)
+        return header
 
     @classmethod
     def get_type(cls, obj):
@@ -60,6 +70,19 @@ class ENABLE_STATUS(BASE_CHOICE):
     ]
 
 
+class EXPORT_JOB_STATUS(BASE_CHOICE):
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    CHOICES = [
+        (PENDING, '排队中'),
+        (RUNNING, '导出中'),
+        (DONE, '已完成'),
+        (FAILED, '失败'),
+    ]
+
+
 class RESOURCE_USAGE(BASE_CHOICE):
     GENERAL = 1
     CHOICES = [
@@ -0,0 +1,48 @@
+from django.db import models
+from django_extensions.db.models import TimeStampedModel
+
+from common.helper import uuid_str
+from common.models.constants import EXPORT_JOB_STATUS
+
+
+class BaseExportJob(TimeStampedModel):
+    """后台导出任务，由common.utils.export_job中的线程池执行"""
+
+    class Meta:
+        abstract = True
+
+    # 每写入多少行把进度写回数据库
+    PROGRESS_STEP = 1000
+
+    job_id = models.CharField('任务ID', max_length=50, unique=True, default=uuid_str)
+    status = models.SmallIntegerField('状态', choices=EXPORT_JOB_STATUS.CHOICES, default=EXPORT_JOB_STATUS.PENDING)
+    file_name = models.CharField('文件名', max_length=200)
+    file = models.FileField('文件', upload_to='export/%Y%m%d', max_length=200, blank=True)
+    rows_written = models.PositiveIntegerField('已写入行数', default=0)
+    total_rows = models.PositiveIntegerField('预计总行数', blank=True, null=True)
+    error = models.TextField('错误信息', blank=True, default='')
+
+    def set_user(self, user):
+        if not user:
+            return
+        setattr(self, 'user', user)
+
+    @property
+    def progress(self):
+        if self.status == EXPORT_JOB_STATUS.DONE:
+            return 1
+        if not self.total_rows:
+            return 0
+        return round(min(self.rows_written / self.total_rows, 1), 4)
+
+    def advance(self, rows=1):
+        self.rows_written += rows
+        if self.rows_written % self.PROGRESS_STEP < rows:
+            self.save_progress()
+
+    def save_progress(self):
+        type(self).objects.filter(pk=self.pk).update(
+            status=self.status,
+            rows_written=self.rows_written,
+            total_rows=self.total_rows
+        )
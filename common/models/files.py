@@ -1,6 +1,12 @@
+import hashlib
+import json
+from collections import Counter
+
 import humanize
 from django.conf import settings
-from django.db import models
+from django.core.files.images import get_image_dimensions
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django_extensions.db.models import TimeStampedModel
 from rest_framework import serializers
 
@@ -40,9 +46,13 @@ class WidthHeightValidation:
 
     def __call__(self, image):
         errors = []
-        if self.max_width and image.image.width > self.max_width:
+        # 只解析图片头部获取尺寸，不解码整张图片
+        width, height = get_image_dimensions(image)
+        if width is None:
+            raise serializers.ValidationError('无法识别的图片')
+        if self.max_width and width > self.max_width:
             errors.append('宽度不可超过{}'.format(self.max_width))
-        if self.max_height and image.image.height > self.max_height:
+        if self.max_height and height > self.max_height:
             errors.append('高度不可超过{}'.format(self.max_height))
         if errors:
             raise serializers.ValidationError(errors)
@@ -79,6 +89,120 @@ class ImageValidator:
         ]
 
 
+def delete_files(storage, names):
+    """批量删除存储中的文件，存储不支持批量删除时逐个删除"""
+    names = [n for n in names if n]
+    if hasattr(storage, 'delete_many'):
+        return storage.delete_many(names)
+    for name in names:
+        storage.delete(name)
+    return []
+
+
+def hash_file(file):
+    """按块读取计算sha256，不把整个文件读入内存"""
+    file.seek(0)
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+class BaseFileBlob(TimeStampedModel):
+    """
+    按内容(及上传时写入的obs_headers)hash索引的存储对象，相同的上传共用同一个对象，ref_count为引用它的记录数，
+    最后一个引用释放时才删除对象
+    """
+
+    class Meta:
+        abstract = True
+
+    sha256 = models.CharField('SHA256', max_length=64, unique=True)
+    name = models.CharField('存储路径', max_length=200, db_index=True)
+    size = models.BigIntegerField('大小', help_text='单位为Byte', default=0)
+    ref_count = models.IntegerField('引用数', default=0)
+
+    # 与并发的上传、释放冲突时最多尝试的次数
+    ACQUIRE_ATTEMPTS = 5
+
+    @classmethod
+    def acquire(cls, digest, size, upload, storage):
+        """
+        返回内容为digest的对象的存储路径并增加引用；不存在时调用upload()上传并返回其路径。
+        并发上传相同内容时只保留先入库的一个，其余上传的对象删除
+        """
+        uploaded = None
+        for _ in range(cls.ACQUIRE_ATTEMPTS):
+            with transaction.atomic():
+                # 锁住记录再增加引用，与release互斥，不会引用到正在释放的对象
+                blob = cls.objects.select_for_update().filter(sha256=digest, ref_count__gt=0).only('name').first()
+                if blob:
+                    cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            if blob:
+                if uploaded and uploaded != blob.name:
+                    storage.delete(uploaded)
+                return blob.name
+            if uploaded is None:
+                uploaded = upload()
+            try:
+                with transaction.atomic():
+                    cls.objects.create(sha256=digest, name=uploaded, size=size, ref_count=1)
+                return uploaded
+            except IntegrityError:
+                continue
+        if uploaded:
+            storage.delete(uploaded)
+        raise IntegrityError('{} 引用对象 {} 失败，已尝试{}次'.format(cls.__name__, digest, cls.ACQUIRE_ATTEMPTS))
+
+    @classmethod
+    def release(cls, names):
+        """
+        减少names的引用，返回应从存储中删除的路径：引用归零的对象，以及启用去重前上传、不在索引中的对象
+        """
+        counts = Counter(n for n in names if n)
+        if not counts:
+            return []
+        with transaction.atomic():
+            blobs = dict(cls.objects.select_for_update().filter(name__in=counts).values_list('name', 'pk'))
+            for name, pk in blobs.items():
+                cls.objects.filter(pk=pk).update(ref_count=F('ref_count') - counts[name])
+            released = cls.objects.filter(pk__in=blobs.values(), ref_count__lte=0)
+            gone = list(released.values_list('name', flat=True))
+            released.delete()
+        return [n for n in counts if n not in blobs] + gone
+
+    @classmethod
+    def save_file(cls, field_file):
+        """在model保存前调用，field_file为尚未上传的FieldFile；内容已存在时直接引用，不再上传"""
+        def upload():
+            field_file.save(field_file.name, field_file.file, save=False)
+            return field_file.name
+
+        digest = hash_file(field_file.file)
+        headers = getattr(field_file.file, 'obs_headers', None)
+        if headers:
+            # content-type、content-disposition随上传写入对象，设置不同的上传(如下载文件名不同)不能共用同一个对象
+            digest = hashlib.sha256((digest + json.dumps(headers, sort_keys=True)).encode('utf-8')).hexdigest()
+        name = cls.acquire(digest, field_file.size, upload, field_file.storage)
+        field_file.name = name
+        field_file._committed = True
+        return name
+
+
+class CommonFileResourceQuerySet(models.QuerySet):
+    def delete(self):
+        storage = self.model._meta.get_field('file').storage
+        names = list(self.values_list('file', flat=True))
+        result = super().delete()
+        if self.model.blob_model is not None:
+            names = self.model.blob_model.release(names)
+        delete_files(storage, names)
+        return result
+
+    delete.queryset_only = True
+
+
 class CommonFileResource(TimeStampedModel):
     class Meta:
         abstract = True
@@ -95,21 +219,48 @@ class CommonFileResource(TimeStampedModel):
     content_type = models.CharField('Content-Type', max_length=100)
     size = models.PositiveIntegerField('大小', help_text='单位为Byte', default=0)
 
+    objects = CommonFileResourceQuerySet.as_manager()
+    # BaseFileBlob的子类，设置后按内容去重，相同内容只上传一次
+    blob_model = None
+
     def save(self, **kwargs):
-        is_new = self.pk is None
+        replaced = None
+        if self.file and not self.file._committed:
+            if self.pk:
+                # 替换文件时，保存后释放原来的文件
+                replaced = type(self).objects.filter(pk=self.pk).values_list('file', flat=True).first()
+            # 在OBS中，给文件设置content-type和content-disposition，随上传一次写入；
+            # 去重时只有内容和这些设置都相同的上传才共用对象
+            self.file.file.obs_headers = self.get_obs_headers()
+            if self.blob_model is not None:
+                self.blob_model.save_file(self.file)
         super().save(**kwargs)
-        if is_new:
-            # 在OBS中，给文件设置content-type和content-disposition
-            disposition = 'attachment; filename="download"; filename*=UTF-8{}{}'.format("''", self.filename)
-            headers = {
-                'contentType': self.content_type,
-            }
-            if self.file_type != FILE_TYPE.IMAGE:
-                headers['contentDisposition'] = disposition
-            storage = self.file.storage
-            storage.client.setObjectMetadata(bucketName=storage.bucket, objectKey=self.file.name, headers=headers)
+        if replaced:
+            self.release_file(replaced)
+
+    def release_file(self, name):
+        """释放记录不再引用的文件：去重时减少引用，引用归零才删除"""
+        storage = self.file.storage
+        if self.blob_model is not None:
+            delete_files(storage, self.blob_model.release([name]))
+        else:
+            storage.delete(name)
+
+    def get_obs_headers(self):
+        headers = {
+            'contentType': self.content_type,
+        }
+        if self.file_type != FILE_TYPE.IMAGE:
+            headers['contentDisposition'] = 'attachment; filename="download"; filename*=UTF-8{}{}'.format(
+                "''", self.filename)
+        return headers
 
     def delete(self, using=None, keep_parents=False):
+        if self.file and self.blob_model is not None:
+            name = self.file.name
+            result = super().delete(using, keep_parents)
+            self.release_file(name)
+            return result
         if self.file:
-            self.file.storage.delete(self.file.name)
+            self.release_file(self.file.name)
         return super().delete(using, keep_parents)
@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.transaction import atomic
 
 
 class BaseApiLog(models.Model):
     class Meta:
         abstract = True
 
+    # BaseApiLogDaily的子类，写入日志时同步增量更新按天的耗时汇总
+    rollup_model = None
+
     METHOD_UNKNOWN = 0
     METHOD_GET = 1
     METHOD_POST = 2
@@ -22,11 +26,18 @@ class BaseApiLog(models.Model):
     user_agent = models.CharField(max_length=500, blank=True, null=True)
     method = models.CharField(choices=METHODS, max_length=50, blank=True, null=True)
     path = models.CharField(max_length=200, blank=True, null=True)
+    # url路由规则，如 blog/api/article/<str:pk>，用于按接口聚合
+    route = models.CharField(max_length=200, blank=True, null=True)
     query = models.CharField(max_length=500, blank=True, null=True)
     payload = models.JSONField(blank=True, null=True)
     req_id = models.CharField(max_length=20, blank=True, null=True)
     resp_status = models.IntegerField(blank=True, null=True)
+    resp_code = models.IntegerField(blank=True, null=True)
     spent = models.PositiveIntegerField(blank=True, null=True)
+    db_spent = models.PositiveIntegerField(blank=True, null=True)
+    db_queries = models.PositiveIntegerField(blank=True, null=True)
+    serialize_spent = models.PositiveIntegerField(blank=True, null=True)
+    render_spent = models.PositiveIntegerField(blank=True, null=True)
     received = models.PositiveBigIntegerField(blank=True, null=True)
     handled = models.PositiveBigIntegerField(blank=True, null=True)
     date = models.DateField(blank=True, null=True, auto_now=True)
@@ -59,3 +70,96 @@ class BaseApiLog(models.Model):
         return str(self.pk)
 
 
+class BaseApiLogDaily(models.Model):
+    """
+    按 日期 + 接口 + method 汇总的请求数、错误数和耗时分位数
+    耗时按固定区间统计直方图，增量合并后从直方图计算分位数(取区间上界，为近似值)
+    """
+
+    class Meta:
+        abstract = True
+        unique_together = [('date', 'route', 'method')]
+
+    # 直方图各区间的上界(ms)，最后一个区间没有上界
+    BUCKETS = [10, 20, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, None]
+    CODE_GENERAL_ERROR = 500
+
+    date = models.DateField()
+    route = models.CharField(max_length=200)
+    method = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    total_spent = models.PositiveBigIntegerField(default=0)
+    max_spent = models.PositiveIntegerField(default=0)
+    p50 = models.PositiveIntegerField(default=0)
+    p90 = models.PositiveIntegerField(default=0)
+    p99 = models.PositiveIntegerField(default=0)
+    histogram = models.JSONField(default=list)
+
+    @classmethod
+    def bucket_index(cls, spent):
+        for index, bound in enumerate(cls.BUCKETS):
+            if bound is None or spent <= bound:
+                return index
+
+    @classmethod
+    def is_error(cls, log):
+        return (log.resp_status or 0) >= 400 or log.resp_code == cls.CODE_GENERAL_ERROR
+
+    def percentile(self, p):
+        target = self.count * p / 100
+        acc = 0
+        for bound, n in zip(self.BUCKETS, self.histogram):
+            acc += n
+            if n and acc >= target:
+                return min(bound, self.max_spent) if bound is not None else self.max_spent
+        return self.max_spent
+
+    @property
+    def avg_spent(self):
+        return int(self.total_spent / self.count) if self.count else 0
+
+    @property
+    def error_rate(self):
+        return round(self.error_count / self.count, 4) if self.count else 0
+
+    @classmethod
+    def rollup(cls, logs):
+        """
+        把一批BaseApiLog合并进汇总表，logs需包含 date/route/path/method/spent/resp_status/resp_code
+        """
+        groups = {}
+        for log in logs:
+            if log.date is None or log.spent is None:
+                continue
+            key = (log.date, (log.route or log.path or '')[:200], log.method or '')
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = cls(date=key[0], route=key[1], method=key[2],
+                                          histogram=[0] * len(cls.BUCKETS))
+            group.count += 1
+            group.error_count += int(cls.is_error(log))
+            group.total_spent += log.spent
+            group.max_spent = max(group.max_spent, log.spent)
+            group.histogram[cls.bucket_index(log.spent)] += 1
+
+        with atomic():
+            for (date, route, method), group in groups.items():
+                obj, _ = cls.objects.select_for_update().get_or_create(
+                    date=date, route=route, method=method,
+                    defaults={'histogram': [0] * len(cls.BUCKETS)}
+                )
+                obj.merge(group)
+                obj.save()
+        return len(groups)
+
+    def merge(self, other):
+        histogram = self.histogram or [0] * len(self.BUCKETS)
+        self.histogram = [a + b for a, b in zip(histogram, other.histogram)]
+        self.count += other.count
+        self.error_count += other.error_count
+        self.total_spent += other.total_spent
+        self.max_spent = max(self.max_spent, other.max_spent)
+        self.p50 = self.percentile(50)
+        self.p90 = self.percentile(90)
+        self.p99 = self.percentile(99)
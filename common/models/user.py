@@ -3,12 +3,17 @@ import time
 import jwt
 from django.conf import settings
 from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
 from django.db import models
 from jwt import ExpiredSignatureError
 
 from common.helper import uuid_str
 from common.models.constants import ERR_MSG
 from common.models.mixins import EnableStatusMixin
+from common.utils.lru import LRUCache
+
+# token -> (payload, 用户版本号, 用户字段快照)，避免每个请求都解码jwt和查询数据库
+_token_cache = LRUCache(maxsize=settings.USER_TOKEN_CACHE_SIZE, ttl=settings.USER_TOKEN_CACHE_TTL)
 
 
 class BaseUser(EnableStatusMixin(), models.Model):
@@ -42,23 +47,79 @@ class BaseUser(EnableStatusMixin(), models.Model):
     @classmethod
     def get_user_by_token(cls, token):
         try:
+            cache_key = (cls._meta.label, token)
+            cached = _token_cache.get(cache_key)
+            if cached is not None:
+                payload, version, snapshot = cached
+                if payload['exp'] > time.time() and version == cls.token_version(payload['id']):
+                    return cls.check_token_user(cls.from_token_snapshot(snapshot), payload)
+                _token_cache.delete(cache_key)
+
             payload = jwt.decode(token, cls.JWT_SECRET,
                                  algorithms=[cls.JWT_TOKEN_ALGORITHM],
                                  options={'require': ['id', 'iat', 'exp']})
             id = payload.get('id')
+            # 先取版本号再查用户，期间如果用户被修改，下次请求会因版本号不一致重新查询
+            version = cls.token_version(id)
             user = cls.objects.filter(pk=id).first()
             if not user:
                 return None
-            iat = payload['iat']
-            if user.reset_pw_time is not None and int(user.reset_pw_time.timestamp()) > iat:
-                # 用户重置密码会重新发放新的token，之前发放的token都作为失效处理
-                return None
-            return user
+            ttl = min(settings.USER_TOKEN_CACHE_TTL, payload['exp'] - time.time())
+            if ttl > 0:
+                _token_cache.set(cache_key, (payload, version, user.token_snapshot()), ttl=ttl)
+            return cls.check_token_user(user, payload)
         except ExpiredSignatureError as e:
             return None
         except Exception as e:
             return None
 
+    @classmethod
+    def check_token_user(cls, user, payload):
+        iat = payload['iat']
+        if user.reset_pw_time is not None and int(user.reset_pw_time.timestamp()) > iat:
+            # 用户重置密码会重新发放新的token，之前发放的token都作为失效处理
+            return None
+        return user
+
+    @classmethod
+    def token_version_key(cls, pk):
+        return 'user:token_ver:{}:{}'.format(cls._meta.label, pk)
+
+    @classmethod
+    def token_version(cls, pk):
+        version_cache = caches[settings.USER_TOKEN_VERSION_CACHE]
+        key = cls.token_version_key(pk)
+        version = version_cache.get(key)
+        if version is None:
+            # 版本号丢失(被淘汰、cache重启)时生成新的随机版本，之前缓存的快照都不会再匹配
+            version = uuid_str()
+            if not version_cache.add(key, version, None):
+                version = version_cache.get(key) or version
+        return version
+
+    @classmethod
+    def bump_token_version(cls, pk):
+        caches[settings.USER_TOKEN_VERSION_CACHE].set(cls.token_version_key(pk), uuid_str(), None)
+
+    def token_snapshot(self):
+        return self._state.db, [getattr(self, f.attname) for f in self._meta.concrete_fields]
+
+    @classmethod
+    def from_token_snapshot(cls, snapshot):
+        db, values = snapshot
+        return cls.from_db(db, [f.attname for f in cls._meta.concrete_fields], values)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # 密码、状态、权限等变化后，缓存的token用户快照全部失效
+        self.bump_token_version(self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        self.bump_token_version(pk)
+        return result
+
     def __eq__(self, other):
         return other and self.pk == other.pk
 
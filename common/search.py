@@ -0,0 +1,160 @@
+"""
+基于SQLite FTS5的本地全文检索
+
+中文没有空格分词，这里在写入和查询前先自行切词：连续的中日韩文字切成相邻的二元组(bigram)，
+英文、数字按单词小写处理，切好的词用空格拼接后交给FTS5的unicode61分词器。
+查询词按同样方式切词后作为短语(phrase)匹配，相邻bigram的短语匹配等价于原文的子串匹配。
+写入时每段中日韩文字末尾再加上最后一个字的unigram，每个字都是某个词的开头，单字查询用前缀匹配。
+排序使用FTS5内置的bm25()，摘要高亮在原文上计算。
+"""
+import html
+import os
+import re
+import sqlite3
+import threading
+
+_CJK = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+_TOKEN_RE = re.compile(r'[{cjk}]+|[^\W_{cjk}]+'.format(cjk=_CJK))
+_CJK_RE = re.compile(r'^[{}]+$'.format(_CJK))
+
+
+def tokenize(text, query=False):
+    """
+    切词；写入时(query=False)在每段中日韩文字的bigram之后追加最后一个字，
+    只在段末追加，段内相邻bigram的位置不变，短语匹配不受影响
+    """
+    tokens = []
+    for word in _TOKEN_RE.findall(text or ''):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+                if not query:
+                    tokens.append(word[-1])
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def _query_term(token):
+    # 单个中日韩文字只能是bigram的开头或段末的unigram，用前缀匹配
+    if len(token) == 1 and _CJK_RE.match(token):
+        return '"{}" *'.format(token)
+    return '"{}"'.format(token)
+
+
+def match_expression(keyword):
+    """每个查询词作为一个短语，多个查询词之间为AND"""
+    phrases = []
+    for word in (keyword or '').split():
+        tokens = tokenize(word, query=True)
+        if tokens:
+            phrases.append(' + '.join(_query_term(t) for t in tokens))
+    return ' '.join(phrases)
+
+
+def highlight(text, keyword, length=None, tag='em'):
+    """
+    在原文中高亮查询词；指定length时截取第一个命中位置附近length个字符作为摘要
+    """
+    text = text or ''
+    words = [w for w in (keyword or '').split() if w]
+    if not words:
+        return html.escape(text[:length] if length else text)
+    pattern = re.compile('|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True)), re.IGNORECASE)
+
+    if length and len(text) > length:
+        first = pattern.search(text)
+        start = max((first.start() if first else 0) - length // 4, 0)
+        end = min(start + length, len(text))
+        start = max(end - length, 0)
+        text = ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+
+    result = []
+    last = 0
+    for m in pattern.finditer(text):
+        result.append(html.escape(text[last:m.start()]))
+        result.append('<{tag}>{}</{tag}>'.format(html.escape(m.group()), tag=tag))
+        last = m.end()
+    result.append(html.escape(text[last:]))
+    return ''.join(result)
+
+
+class SearchIndex:
+    """
+    一个FTS5表：fields为 (字段名, bm25权重) 的列表，文档以整数id为rowid，原文同时保存用于生成摘要
+    """
+
+    def __init__(self, path, table, fields):
+        self.path = path
+        self.table = table
+        self.fields = [f for f, _ in fields]
+        self.weights = [w for _, w in fields]
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.create_table(conn)
+            self.local.connection = conn
+        return conn
+
+    def create_table(self, conn):
+        columns = self.fields + ['raw_{} UNINDEXED'.format(f) for f in self.fields]
+        conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, tokenize=\'unicode61\')'.format(
+            self.table, ', '.join(columns)))
+
+    def _row(self, doc_id, doc):
+        values = [' '.join(tokenize(doc.get(f))) for f in self.fields]
+        raw_values = [doc.get(f) or '' for f in self.fields]
+        return [doc_id] + values + raw_values
+
+    def index_many(self, docs):
+        """docs为 (id, {字段名: 文本}) 的可迭代对象，已存在的文档会被替换"""
+        conn = self.connection
+        placeholders = ', '.join(['?'] * (1 + 2 * len(self.fields)))
+        columns = ', '.join(['rowid'] + self.fields + ['raw_{}'.format(f) for f in self.fields])
+        with conn:
+            for doc_id, doc in docs:
+                conn.execute('DELETE FROM {} WHERE rowid = ?'.format(self.table), [doc_id])
+                conn.execute('INSERT INTO {} ({}) VALUES ({})'.format(self.table, columns, placeholders),
+                             self._row(doc_id, doc))
+
+    def index(self, doc_id, doc):
+        self.index_many([(doc_id, doc)])
+
+    def remove(self, doc_id):
+        with self.connection as conn:
+            conn.execute('DELETE FROM {} WHERE rowid = ?'.format(self.table), [doc_id])
+
+    def clear(self):
+        with self.connection as conn:
+            conn.execute('DELETE FROM {}'.format(self.table))
+
+    def count(self, keyword):
+        expression = match_expression(keyword)
+        if not expression:
+            return 0
+        sql = 'SELECT count(*) FROM {t} WHERE {t} MATCH ?'.format(t=self.table)
+        return self.connection.execute(sql, [expression]).fetchone()[0]
+
+    def search(self, keyword, limit=10, offset=0):
+        """
+        返回按相关度排序的 [{'id', 'score', 字段名: 原文, ...}]，score越小越相关(bm25)
+        """
+        expression = match_expression(keyword)
+        if not expression:
+            return []
+        raw_columns = ', '.join('raw_{f} AS {f}'.format(f=f) for f in self.fields)
+        weights = ', '.join(str(w) for w in self.weights)
+        sql = ('SELECT rowid AS id, bm25({t}, {w}) AS score, {c} FROM {t} WHERE {t} MATCH ? '
+               'ORDER BY score LIMIT ? OFFSET ?').format(t=self.table, w=weights, c=raw_columns)
+        rows = self.connection.execute(sql, [expression, limit, offset]).fetchall()
+        return [dict(row) for row in rows]
@@ -1,12 +1,23 @@
 # -*- coding: UTF-8 -*-
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
 from django.conf import settings
 from django.core.files.storage import Storage
 from django.utils.deconstruct import deconstructible
 from django.utils.functional import cached_property
-from obs import ObsClient
+from obs import ObsClient, CompleteMultipartUploadRequest, CompletePart, DeleteObjectsRequest, Object, PutObjectHeader
+
+from common.utils.file_cache import FileCache
+from common.utils.lru import LRUCache
+
+
+class ObsError(IOError):
+    def __init__(self, action, name, response):
+        self.status = getattr(response, 'status', None)
+        self.reason = getattr(response, 'errorMessage', None) or getattr(response, 'reason', None)
+        super().__init__('OBS {} {} 失败: {} {}'.format(action, name, self.status, self.reason))
 
 
 class Config:
@@ -15,15 +26,28 @@ class Config:
         self.secret_key = option['SecretKey']
         self.server = option['Server']
         self.url = option['URL']
+        # 超过阈值的文件分段上传，每段part_size字节，最多concurrency段同时上传
+        self.part_size = option.get('PartSize', 10 * 1024 * 1024)
+        self.multipart_threshold = option.get('MultipartThreshold', 20 * 1024 * 1024)
+        self.upload_concurrency = option.get('UploadConcurrency', 4)
+        # 读取时的本地缓存：对象文件缓存在cache_dir，总大小不超过cache_max_size字节，以ETag校验是否过期；
+        # 元数据(是否存在、大小、ETag)在进程内缓存meta_cache_ttl秒，期间其他进程对同一对象的修改不可见
+        self.cache_dir = option.get('CacheDir', str(Path(tempfile.gettempdir(), 'obs-cache')))
+        self.cache_max_size = option.get('CacheMaxSize', 512 * 1024 * 1024)
+        self.meta_cache_size = option.get('MetaCacheSize', 4096)
+        self.meta_cache_ttl = option.get('MetaCacheTTL', 60)
 
 
 @deconstructible()
 class HuaweiStorage(Storage):
-    def __init__(self, option=None):
+    def __init__(self, option=None, client=None):
         if not option:
             option = settings.HUAWEI_OBS_SETTINGS
         self.config = Config(option)
         self.bucket = option['Bucket']
+        if client is not None:
+            # 可注入与ObsClient接口一致的客户端，如测试用的本地fake
+            self.client = client
 
     @cached_property
     def client(self):
@@ -31,33 +55,135 @@ class HuaweiStorage(Storage):
                          secret_access_key=self.config.secret_key,
                          server=self.config.server)
 
+    @cached_property
+    def file_cache(self):
+        return FileCache(Path(self.config.cache_dir, self.bucket), self.config.cache_max_size)
+
+    @cached_property
+    def meta_cache(self):
+        return LRUCache(self.config.meta_cache_size, self.config.meta_cache_ttl)
+
     def _check_url(self, name):
         return name.startswith('http')
 
+    def _metadata(self, name):
+        """对象不存在时返回None，结果在meta_cache中缓存"""
+        meta = self.meta_cache.get(name)
+        if meta is None:
+            response = self.client.getObjectMetadata(self.bucket, name)
+            if response.status == 404:
+                meta = {}
+            else:
+                body = self._check_response('getObjectMetadata', name, response).body
+                meta = {'size': body.contentLength, 'etag': body.etag}
+            self.meta_cache.set(name, meta)
+        return meta or None
+
+    def _invalidate(self, name):
+        self.meta_cache.delete(name)
+        self.file_cache.delete(name)
+
     def _open(self, name, mode='rb'):
         if self._check_url(name):
             return b''
 
-        tmpf = Path(tempfile.gettempdir(), name)
-        parent = tmpf.parent
-        if not parent.exists():
-            parent.mkdir(parents=True)
-        self.client.getObject(self.bucket, name, downloadPath=tmpf)
-        return open(tmpf, mode)
+        meta = self._metadata(name)
+        if meta is None:
+            raise FileNotFoundError(name)
+        f = self.file_cache.get(name, meta['etag'], mode)
+        if f is None:
+            tmpf = self.file_cache.temp_path(name)
+            try:
+                response = self.client.getObject(self.bucket, name, downloadPath=str(tmpf))
+                if response.status == 404:
+                    self.meta_cache.delete(name)
+                    raise FileNotFoundError(name)
+                self._check_response('getObject', name, response)
+                f = self.file_cache.put(name, meta['etag'], tmpf, mode)
+            finally:
+                if tmpf.exists():
+                    tmpf.unlink()
+        return f
+
+    def _check_response(self, action, name, response):
+        if response.status >= 300:
+            raise ObsError(action, name, response)
+        return response
 
     def _save(self, name, content):
         if self._check_url(name):
             return name
 
-        _ = self.client.putObject(self.bucket, name, content)
+        # content上的obs_headers(contentType、contentDisposition)随上传一起写入，不再单独设置元数据
+        headers = getattr(content, 'obs_headers', None) or {}
+        if content.size is not None and content.size > self.config.multipart_threshold:
+            self._multipart_upload(name, content, headers)
+        else:
+            content.seek(0)
+            # SDK默认上传后关闭content，调用方(如生成缩略图)之后还要读取
+            response = self.client.putObject(
+                self.bucket, name, content,
+                headers=PutObjectHeader(contentType=headers.get('contentType')),
+                autoClose=False,
+                extensionHeaders=self._extension_headers(headers),
+            )
+            self._check_response('putObject', name, response)
+        self._invalidate(name)
         return name
 
+    def _extension_headers(self, headers):
+        if headers.get('contentDisposition'):
+            return {'Content-Disposition': headers['contentDisposition']}
+        return None
+
+    def _iter_parts(self, content):
+        content.seek(0)
+        part_num = 1
+        while True:
+            data = content.read(self.config.part_size)
+            if not data:
+                break
+            yield part_num, data
+            part_num += 1
+
+    def _upload_part(self, name, upload_id, part_num, data):
+        response = self.client.uploadPart(self.bucket, name, part_num, upload_id, object=data)
+        self._check_response('uploadPart', name, response)
+        return CompletePart(partNum=part_num, etag=response.body.etag)
+
+    def _multipart_upload(self, name, content, headers):
+        response = self.client.initiateMultipartUpload(
+            self.bucket, name,
+            contentType=headers.get('contentType'),
+            extensionHeaders=self._extension_headers(headers),
+        )
+        upload_id = self._check_response('initiateMultipartUpload', name, response).body.uploadId
+        concurrency = max(self.config.upload_concurrency, 1)
+        parts = []
+        try:
+            # 主线程按顺序读取分段，同时在途的分段不超过concurrency个，内存占用约为concurrency * part_size
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                pending = set()
+                for part_num, data in self._iter_parts(content):
+                    if len(pending) >= concurrency:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        parts.extend(f.result() for f in done)
+                    pending.add(executor.submit(self._upload_part, name, upload_id, part_num, data))
+                parts.extend(f.result() for f in pending)
+            parts.sort(key=lambda p: p.partNum)
+            response = self.client.completeMultipartUpload(
+                self.bucket, name, upload_id, CompleteMultipartUploadRequest(parts=parts)
+            )
+            self._check_response('completeMultipartUpload', name, response)
+        except Exception:
+            self.client.abortMultipartUpload(self.bucket, name, upload_id)
+            raise
+
     def exists(self, name):
         if self._check_url(name):
             return True
 
-        response = self.client.getObjectMetadata(self.bucket, name)
-        return response.status == 200
+        return self._metadata(name) is not None
 
     def url(self, name):
         if self._check_url(name):
@@ -69,11 +195,75 @@ class HuaweiStorage(Storage):
         if self._check_url(name):
             return 0
 
-        response = self.client.getObjectMetadata(self.bucket, name)
-        return response.body.contentLength
+        meta = self._metadata(name)
+        if meta is None:
+            raise FileNotFoundError(name)
+        return meta['size']
 
     def delete(self, name):
         if self._check_url(name):
             return
 
         self.client.deleteObject(self.bucket, name)
+        self._invalidate(name)
+
+    # 单次批量删除最多1000个对象
+    DELETE_BATCH_SIZE = 1000
+
+    def delete_many(self, names):
+        """批量删除，返回删除失败的 [(name, 原因)]"""
+        names = [n for n in names if not self._check_url(n)]
+        failed = []
+        for i in range(0, len(names), self.DELETE_BATCH_SIZE):
+            chunk = names[i:i + self.DELETE_BATCH_SIZE]
+            request = DeleteObjectsRequest(quiet=True, objects=[Object(key=n) for n in chunk])
+            response = self.client.deleteObjects(self.bucket, request)
+            if response.status >= 300:
+                failed.extend((n, ObsError('deleteObjects', n, response)) for n in chunk)
+                continue
+            for error in response.body.error or []:
+                failed.append((error.key, '{} {}'.format(error.code, error.message)))
+            for n in chunk:
+                self._invalidate(n)
+        return failed
+
+    def copy(self, src, dst):
+        response = self.client.copyObject(self.bucket, src, self.bucket, dst)
+        self._check_response('copyObject', src, response)
+        self._invalidate(dst)
+        return dst
+
+    def copy_many(self, pairs, concurrency=None):
+        """并发复制 [(src, dst)]，同时进行的请求不超过concurrency个，返回失败的 [((src, dst), 异常)]"""
+        def _copy(pair):
+            try:
+                self.copy(*pair)
+            except Exception as e:
+                return pair, e
+
+        concurrency = max(concurrency or self.config.upload_concurrency, 1)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return [r for r in executor.map(_copy, pairs) if r]
+
+    def move_many(self, pairs, concurrency=None):
+        """复制成功后批量删除源对象，返回失败的 [((src, dst), 原因)]"""
+        pairs = list(pairs)
+        failed = self.copy_many(pairs, concurrency)
+        failed_pairs = {pair for pair, _ in failed}
+        moved = {src: (src, dst) for src, dst in pairs if (src, dst) not in failed_pairs}
+        for src, reason in self.delete_many(list(moved)):
+            failed.append((moved[src], reason))
+        return failed
+
+    def iter_objects(self, prefix='', page_size=1000):
+        """按前缀分页列出对象，逐个返回 key、size、etag、lastModified"""
+        marker = None
+        while True:
+            response = self.client.listObjects(self.bucket, prefix=prefix, marker=marker, max_keys=page_size)
+            body = self._check_response('listObjects', prefix, response).body
+            contents = body.contents or []
+            for content in contents:
+                yield content
+            if not body.is_truncated or not contents:
+                break
+            marker = body.next_marker or contents[-1].key
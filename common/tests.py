@@ -0,0 +1,258 @@
+import os
+import tempfile
+import threading
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+from PIL import Image
+
+from common.db.backends.mysql_pool.base import ConnectionPool
+from common.storage import HuaweiStorage, ObsError
+from common.utils.fake_obs import FakeObsClient
+from common.utils.file_cache import FileCache
+from common.utils.images import submit_variants
+from common.utils.rate_limit import MemoryBackend, CacheBackend
+from common.views.views import redact_payload, REDACTED
+
+
+class RedactPayloadTest(SimpleTestCase):
+    def test_redact_sensitive_keys(self):
+        payload = {
+            'username': 'admin',
+            'init_password': '123456',
+            'init_password_confirm': '123456',
+            'items': [{'New_Password': 'x', 'phone': '1'}],
+        }
+        self.assertEqual(redact_payload(payload, ('password',)), {
+            'username': 'admin',
+            'init_password': REDACTED,
+            'init_password_confirm': REDACTED,
+            'items': [{'New_Password': REDACTED, 'phone': '1'}],
+        })
+        self.assertEqual(redact_payload('raw body', ('password',)), 'raw body')
+
+
+class RateLimitBackendTest(SimpleTestCase):
+    def test_memory_backend_sliding_window(self):
+        backend = MemoryBackend()
+        with mock.patch('common.utils.rate_limit.time.monotonic') as now:
+            for t, allowed in [(0, True), (1, True), (2, False), (9.9, False), (10.5, True), (10.8, False),
+                               (11.5, True)]:
+                now.return_value = t
+                self.assertEqual(backend.hit('k', 2, 10), allowed, t)
+            backend.reset('k', 10)
+            self.assertTrue(backend.hit('k', 2, 10))
+
+    def test_cache_backend_weighted_window(self):
+        caches['default'].clear()
+        backend = CacheBackend()
+        with mock.patch('common.utils.rate_limit.time.time') as now:
+            # 窗口[100, 110)内用满2次
+            now.return_value = 100
+            self.assertEqual([backend.hit('k', 2, 10) for _ in range(3)], [True, True, False])
+            # 下个窗口过半，上个窗口按一半计为1次，只能再用1次
+            now.return_value = 115
+            self.assertEqual([backend.hit('k', 2, 10) for _ in range(2)], [True, False])
+            # 再下个窗口过半，上个窗口的1次计为0.5次
+            now.return_value = 125
+            self.assertEqual([backend.hit('k', 2, 10) for _ in range(3)], [True, True, False])
+            backend.reset('k', 10)
+            self.assertTrue(backend.hit('k', 2, 10))
+
+
+class FakeConnection:
+    def __init__(self, ping_ok=True):
+        self.ping_ok = ping_ok
+        self.pings = 0
+        self.closed = False
+
+    def ping(self):
+        self.pings += 1
+        if not self.ping_ok:
+            raise OSError('gone away')
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.created = []
+        patcher = mock.patch('common.db.backends.mysql_pool.base.time.monotonic', return_value=1000)
+        self.now = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self):
+        connection = FakeConnection()
+        self.created.append(connection)
+        return connection
+
+    def test_reuse_released_connection(self):
+        pool = ConnectionPool(max_size=2)
+        connection, created_at = pool.acquire(self.connect)
+        pool.release(connection, created_at)
+        self.assertEqual(pool.acquire(self.connect), (connection, created_at))
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(connection.pings, 0)
+
+    def test_close_beyond_max_size(self):
+        pool = ConnectionPool(max_size=1)
+        items = [pool.acquire(self.connect) for _ in range(2)]
+        for item in items:
+            pool.release(*item)
+        self.assertEqual([c.closed for c in self.created], [False, True])
+        self.assertEqual(len(pool.idle), 1)
+
+    def test_lifetime(self):
+        pool = ConnectionPool(max_lifetime=60, health_check_after=1000)
+        old = pool.acquire(self.connect)
+        pool.release(*old)
+        # 空闲期间超过最长使用时间，取出时关闭并重建
+        self.now.return_value = 1061
+        connection, created_at = pool.acquire(self.connect)
+        self.assertTrue(old[0].closed)
+        self.assertIsNot(connection, old[0])
+        self.assertEqual(created_at, 1061)
+        # 使用期间超过最长使用时间，放回时直接关闭
+        self.now.return_value = 1200
+        pool.release(connection, created_at)
+        self.assertTrue(connection.closed)
+        self.assertEqual(len(pool.idle), 0)
+
+    def test_ping_after_idle(self):
+        pool = ConnectionPool(health_check_after=10)
+        healthy = pool.acquire(self.connect)
+        pool.release(*healthy)
+        self.now.return_value = 1011
+        self.assertIs(pool.acquire(self.connect)[0], healthy[0])
+        self.assertEqual(healthy[0].pings, 1)
+
+        healthy[0].ping_ok = False
+        pool.release(*healthy)
+        self.now.return_value = 1022
+        connection, _ = pool.acquire(self.connect)
+        self.assertTrue(healthy[0].closed)
+        self.assertIs(connection, self.created[-1])
+        self.assertEqual(len(self.created), 2)
+
+
+def fake_storage(cache_dir, **option):
+    option = {
+        'AccessKey': 'ak', 'SecretKey': 'sk', 'Server': 'obs.local', 'URL': 'https://obs.local',
+        'Bucket': 'test', 'CacheDir': cache_dir, **option,
+    }
+    return HuaweiStorage(option, client=FakeObsClient())
+
+
+class HuaweiStorageTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+
+    def test_multipart_upload(self):
+        storage = fake_storage(self.cache_dir, PartSize=4, MultipartThreshold=10, UploadConcurrency=2)
+        data = os.urandom(25)
+        storage.save('file/a.bin', ContentFile(data))
+        client = storage.client
+        self.assertEqual(client.objects['file/a.bin']['data'], data)
+        self.assertEqual([c[2]['partNumber'] for c in client.calls_of('uploadPart')], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(len(client.calls_of('completeMultipartUpload')), 1)
+        self.assertFalse(client.calls_of('putObject'))
+
+    def test_multipart_abort_on_failure(self):
+        storage = fake_storage(self.cache_dir, PartSize=4, MultipartThreshold=10)
+        storage.client.fail_part = 2
+        with self.assertRaises(ObsError):
+            storage.save('file/a.bin', ContentFile(os.urandom(25)))
+        self.assertEqual(len(storage.client.calls_of('abortMultipartUpload')), 1)
+        self.assertFalse(storage.client.calls_of('completeMultipartUpload'))
+        self.assertNotIn('file/a.bin', storage.client.objects)
+        self.assertFalse(storage.client.uploads)
+
+    def test_headers_sent_with_upload(self):
+        storage = fake_storage(self.cache_dir, PartSize=4, MultipartThreshold=10)
+        headers = {'contentType': 'text/csv', 'contentDisposition': 'attachment; filename="download"'}
+        for name, data in [('file/small.csv', b'a,b'), ('file/large.csv', os.urandom(25))]:
+            content = ContentFile(data)
+            content.obs_headers = headers
+            storage.save(name, content)
+        client = storage.client
+        (_, _, put), = client.calls_of('putObject')
+        self.assertEqual(put['headers']['contentType'], 'text/csv')
+        self.assertEqual(put['extensionHeaders'], {'Content-Disposition': 'attachment; filename="download"'})
+        (_, _, initiate), = client.calls_of('initiateMultipartUpload')
+        self.assertEqual(initiate['contentType'], 'text/csv')
+        self.assertEqual(initiate['extensionHeaders'], {'Content-Disposition': 'attachment; filename="download"'})
+        self.assertFalse(client.calls_of('setObjectMetadata'))
+
+    def test_content_still_open_after_save(self):
+        storage = fake_storage(self.cache_dir)
+        # ContentFile的close()不做事，用真正会关闭的上传文件
+        content = SimpleUploadedFile('a.txt', b'hello')
+        storage.save('file/a.txt', content)
+        content.seek(0)
+        self.assertEqual(content.read(), b'hello')
+
+    def test_metadata_and_file_cache(self):
+        storage = fake_storage(self.cache_dir)
+        client = storage.client
+        storage.save('file/a.txt', ContentFile(b'hello'))
+        client.calls.clear()
+        self.assertTrue(storage.exists('file/a.txt'))
+        self.assertEqual(storage.size('file/a.txt'), 5)
+        for _ in range(2):
+            with storage.open('file/a.txt') as f:
+                self.assertEqual(f.read(), b'hello')
+        self.assertEqual(len(client.calls_of('getObjectMetadata')), 1)
+        self.assertEqual(len(client.calls_of('getObject')), 1)
+
+        # 其他进程改写了对象：元数据过期后按新ETag重新下载
+        client._store('file/a.txt', b'world', {})
+        storage.meta_cache.delete('file/a.txt')
+        with storage.open('file/a.txt') as f:
+            self.assertEqual(f.read(), b'world')
+        self.assertEqual(len(client.calls_of('getObject')), 2)
+
+    def test_file_cache_evicted_while_open(self):
+        cache = FileCache(self.cache_dir, max_size=8)
+
+        def put(key, data):
+            src = cache.temp_path(key)
+            src.write_bytes(data)
+            cache.put(key, 'v1', src).close()
+
+        put('a', b'aaaaa')
+        f = cache.get('a', 'v1')
+        # 写入b会淘汰并删除a，已打开的a仍可读完
+        put('b', b'bbbbb')
+        with f:
+            self.assertEqual(f.read(), b'aaaaa')
+        self.assertIsNone(cache.get('a', 'v1'))
+        with cache.get('b', 'v1') as f:
+            self.assertEqual(f.read(), b'bbbbb')
+        self.assertIsNone(cache.get('b', 'v2'))
+
+
+class ImageVariantsTest(SimpleTestCase):
+    def test_callback_runs_off_result_thread(self):
+        buf = BytesIO()
+        Image.new('RGB', (64, 32), 'red').save(buf, 'PNG')
+        done = threading.Event()
+        result = {}
+
+        def callback(variants):
+            result['thread'] = threading.current_thread().name
+            result['variants'] = variants
+            done.set()
+
+        submit_variants(buf.getvalue(), {'s': (16, 16)}, callback).result(timeout=60)
+        self.assertTrue(done.wait(10))
+        # 上传缩略图等IO在回调线程池中执行，不阻塞进程池的结果线程
+        self.assertTrue(result['thread'].startswith('image-variants'))
+        with Image.open(BytesIO(result['variants']['s'])) as thumb:
+            self.assertEqual(thumb.size, (16, 8))
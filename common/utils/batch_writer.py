@@ -0,0 +1,110 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    后台批量写入：调用方把记录放进有界队列后立即返回，由后台线程攒批后调用handler(records)
+    队列满时直接丢弃新记录并计数，不阻塞请求线程；进程退出时会把队列中剩余的记录写完
+    """
+
+    def __init__(self, name, handler, max_queue_size=10000, batch_size=200, flush_interval=1.0):
+        self.name = name
+        self.handler = handler
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def _started(self):
+        return self.thread is not None and self.pid == os.getpid() and self.thread.is_alive()
+
+    def _ensure_started(self):
+        if self._started():
+            return
+        with self.lock:
+            if self._started():
+                return
+            # fork出的子进程里没有父进程的线程，需要在当前进程重新创建
+            self.queue = queue.Queue(self.max_queue_size)
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='BatchWriter-{}'.format(self.name), daemon=True)
+            self.thread.start()
+
+    def put(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        q = self.queue
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = q.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    q.task_done()
+                    stopping = True
+                    break
+                batch.append(record)
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    q.task_done()
+
+    def _write(self, batch):
+        try:
+            self.handler(batch)
+            self.written += len(batch)
+        except Exception as ex:
+            self.failed += len(batch)
+            logging.error('BatchWriter {} failed to write {} records'.format(self.name, len(batch)), exc_info=ex)
+
+    def flush(self):
+        """阻塞直到当前队列中的记录全部写完"""
+        if self._started():
+            self.queue.join()
+
+    def close(self, timeout=5):
+        if not self._started():
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        if self.dropped or self.failed:
+            logging.warning('BatchWriter {} closed, stats: {}'.format(self.name, self.stats()))
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize() if self.queue else 0,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
@@ -0,0 +1,33 @@
+import time
+
+
+def run_bench(func, times):
+    """
+    串行执行times次func，返回吞吐和耗时分布(毫秒)，供bench_*命令使用
+    """
+    spent = []
+    start = time.perf_counter()
+    for i in range(times):
+        t = time.perf_counter()
+        func(i)
+        spent.append((time.perf_counter() - t) * 1000)
+    total = time.perf_counter() - start
+    spent.sort()
+    return {
+        'ops': times / total if total else 0,
+        'mean': sum(spent) / len(spent) if spent else 0,
+        'p50': percentile(spent, 50),
+        'p99': percentile(spent, 99),
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def format_result(name, result):
+    return '{:<24} {:>10.1f} ops/s  mean {:>8.3f}ms  p50 {:>8.3f}ms  p99 {:>8.3f}ms'.format(
+        name, result['ops'], result['mean'], result['p50'], result['p99'])
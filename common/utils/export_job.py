@@ -0,0 +1,60 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryFile
+from threading import Lock
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connections
+
+from common.models.constants import EXPORT_JOB_STATUS
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS,
+                                               thread_name_prefix='ExportJob')
+    return _executor
+
+
+def submit_export_job(view, queryset, job):
+    """
+    view为发起下载请求的BaseExcelComposeMixin视图实例，queryset为已经过滤好的查询，
+    都在请求线程中准备好后交给线程池执行
+    """
+    return get_executor().submit(run_export_job, view, queryset, job)
+
+
+def run_export_job(view, queryset, job):
+    close_old_connections()
+    try:
+        job.status = EXPORT_JOB_STATUS.RUNNING
+        job.total_rows = view.estimate_export_rows(queryset)
+        job.save_progress()
+
+        view.export_job = job
+        data = view.export(queryset)
+        if not hasattr(data, 'read'):
+            tmp_file = TemporaryFile()
+            for chunk in data:
+                tmp_file.write(chunk)
+            tmp_file.seek(0)
+            data = tmp_file
+        with data:
+            job.file.save(job.file_name, File(data), save=False)
+        job.status = EXPORT_JOB_STATUS.DONE
+        job.save()
+    except Exception as ex:
+        logging.error('Export job {} failed'.format(job.job_id), exc_info=ex)
+        job.status = EXPORT_JOB_STATUS.FAILED
+        job.error = repr(ex)
+        job.save()
+    finally:
+        # 线程池中的线程不会触发request_finished，需要自己关闭数据库连接
+        connections.close_all()
@@ -0,0 +1,163 @@
+"""
+进程内的OBS客户端替身，接口与 obs.ObsClient 中HuaweiStorage用到的方法一致，
+对象保存在内存中，用于测试和基准：HuaweiStorage(option, client=FakeObsClient())
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+def _response(status=200, body=None, reason=None):
+    return SimpleNamespace(status=status, body=body, reason=reason, errorMessage=reason)
+
+
+def _read(content):
+    if content is None:
+        return b''
+    if isinstance(content, str):
+        return content.encode('UTF-8')
+    if isinstance(content, bytes):
+        return content
+    return content.read()
+
+
+class FakeObsClient:
+    def __init__(self, latency=0):
+        # 每次调用模拟的网络往返时间(秒)
+        self.latency = latency
+        # key -> {'data', 'etag', 'headers', 'last_modified'}
+        self.objects = {}
+        self.uploads = {}
+        # (方法名, key, 关键参数)，测试据此断言调用次数和参数
+        self.calls = []
+        self.fail_part = None
+        self.lock = threading.Lock()
+
+    def _call(self, method, key, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls.append((method, key, kwargs))
+
+    def calls_of(self, method):
+        return [c for c in self.calls if c[0] == method]
+
+    def _store(self, key, data, headers):
+        with self.lock:
+            self.objects[key] = {
+                'data': data,
+                'etag': '"{}"'.format(hashlib.md5(data).hexdigest()),
+                'headers': headers,
+                'last_modified': datetime.now(timezone.utc),
+            }
+
+    def putObject(self, bucketName, objectKey, content, metadata=None, headers=None, autoClose=True,
+                  extensionHeaders=None, **kwargs):
+        self._call('putObject', objectKey, headers=headers, extensionHeaders=extensionHeaders)
+        data = _read(content)
+        # 与SDK一致：默认上传后关闭文件对象
+        if autoClose and hasattr(content, 'close'):
+            content.close()
+        self._store(objectKey, data, {
+            'contentType': headers.get('contentType') if headers else None,
+            'extensionHeaders': extensionHeaders,
+        })
+        return _response(body=SimpleNamespace(etag=self.objects[objectKey]['etag']))
+
+    def initiateMultipartUpload(self, bucketName, objectKey, contentType=None, extensionHeaders=None, **kwargs):
+        self._call('initiateMultipartUpload', objectKey, contentType=contentType, extensionHeaders=extensionHeaders)
+        with self.lock:
+            upload_id = 'upload-{}'.format(len(self.uploads) + 1)
+            self.uploads[upload_id] = {
+                'key': objectKey,
+                'parts': {},
+                'headers': {'contentType': contentType, 'extensionHeaders': extensionHeaders},
+            }
+        return _response(body=SimpleNamespace(uploadId=upload_id))
+
+    def uploadPart(self, bucketName, objectKey, partNumber, uploadId, object=None, **kwargs):
+        self._call('uploadPart', objectKey, partNumber=partNumber, uploadId=uploadId)
+        if self.fail_part == partNumber:
+            return _response(500, reason='fake failure')
+        data = _read(object)
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        with self.lock:
+            self.uploads[uploadId]['parts'][partNumber] = (etag, data)
+        return _response(body=SimpleNamespace(etag=etag))
+
+    def completeMultipartUpload(self, bucketName, objectKey, uploadId, completeMultipartUploadRequest, **kwargs):
+        self._call('completeMultipartUpload', objectKey, uploadId=uploadId)
+        with self.lock:
+            upload = self.uploads.pop(uploadId)
+        parts = completeMultipartUploadRequest.parts
+        if [p.partNum for p in parts] != sorted(upload['parts']) or \
+                any(upload['parts'][p.partNum][0] != p.etag for p in parts):
+            return _response(400, reason='InvalidPart')
+        self._store(objectKey, b''.join(upload['parts'][p.partNum][1] for p in parts), upload['headers'])
+        return _response()
+
+    def abortMultipartUpload(self, bucketName, objectKey, uploadId, **kwargs):
+        self._call('abortMultipartUpload', objectKey, uploadId=uploadId)
+        with self.lock:
+            self.uploads.pop(uploadId, None)
+        return _response(204)
+
+    def getObjectMetadata(self, bucketName, objectKey, **kwargs):
+        self._call('getObjectMetadata', objectKey)
+        obj = self.objects.get(objectKey)
+        if obj is None:
+            return _response(404, reason='Not Found')
+        return _response(body=SimpleNamespace(contentLength=len(obj['data']), etag=obj['etag'],
+                                              contentType=obj['headers'].get('contentType')))
+
+    def setObjectMetadata(self, bucketName, objectKey, **kwargs):
+        self._call('setObjectMetadata', objectKey, **kwargs)
+        return _response()
+
+    def getObject(self, bucketName, objectKey, downloadPath=None, **kwargs):
+        self._call('getObject', objectKey)
+        obj = self.objects.get(objectKey)
+        if obj is None:
+            return _response(404, reason='Not Found')
+        with open(downloadPath, 'wb') as f:
+            f.write(obj['data'])
+        return _response(body=SimpleNamespace(etag=obj['etag']))
+
+    def deleteObject(self, bucketName, objectKey, **kwargs):
+        self._call('deleteObject', objectKey)
+        with self.lock:
+            self.objects.pop(objectKey, None)
+        return _response(204)
+
+    def deleteObjects(self, bucketName, deleteObjectsRequest, **kwargs):
+        keys = [o.key for o in deleteObjectsRequest.objects]
+        self._call('deleteObjects', None, keys=keys)
+        with self.lock:
+            for key in keys:
+                self.objects.pop(key, None)
+        return _response(body=SimpleNamespace(deleted=[SimpleNamespace(key=k) for k in keys], error=[]))
+
+    def copyObject(self, sourceBucketName, sourceObjectKey, destBucketName, destObjectKey, **kwargs):
+        self._call('copyObject', sourceObjectKey, dest=destObjectKey)
+        obj = self.objects.get(sourceObjectKey)
+        if obj is None:
+            return _response(404, reason='Not Found')
+        self._store(destObjectKey, obj['data'], obj['headers'])
+        return _response()
+
+    def listObjects(self, bucketName, prefix=None, marker=None, max_keys=None, **kwargs):
+        self._call('listObjects', prefix, marker=marker)
+        keys = sorted(k for k in self.objects if k.startswith(prefix or '') and (marker is None or k > marker))
+        page = keys[:max_keys or 1000]
+        contents = [SimpleNamespace(
+            key=k,
+            size=len(self.objects[k]['data']),
+            etag=self.objects[k]['etag'],
+            # 与SDK一致：转成本机时区的 YYYY/MM/DD HH:MM:SS
+            lastModified=self.objects[k]['last_modified'].astimezone().strftime('%Y/%m/%d %H:%M:%S'),
+        ) for k in page]
+        truncated = len(keys) > len(page)
+        # 与OBS一致：不指定delimiter时不返回next_marker
+        return _response(body=SimpleNamespace(contents=contents, is_truncated=truncated, next_marker=None))
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class FileCache:
+    """
+    本地磁盘的文件缓存，总大小超过max_size(字节)时按最近使用淘汰；每个文件记录其版本(如ETag)，版本不一致视为未命中。
+    文件名由key的hash生成，写入先落临时文件再rename，多进程共用同一目录时也不会读到写了一半的文件
+    """
+
+    def __init__(self, root, max_size=512 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.index = None
+        self.total_size = 0
+
+    def _ensure_index(self):
+        # 首次使用时扫描目录，按最近访问时间恢复LRU顺序
+        if self.index is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.root.glob('*.data'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, path.stem, stat.st_size))
+        entries.sort()
+        self.index = OrderedDict((digest, size) for _, digest, size in entries)
+        self.total_size = sum(self.index.values())
+
+    def _digest(self, key):
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def _paths(self, digest):
+        return self.root / '{}.data'.format(digest), self.root / '{}.version'.format(digest)
+
+    def _remove(self, digest):
+        size = self.index.pop(digest, None)
+        if size is not None:
+            self.total_size -= size
+        for path in self._paths(digest):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def get(self, key, version, mode='rb'):
+        """
+        命中且版本一致时返回打开的文件，否则返回None。在锁内打开，之后即使被其他线程淘汰、删除，
+        已打开的文件仍可读完
+        """
+        digest = self._digest(key)
+        data_path, version_path = self._paths(digest)
+        with self.lock:
+            self._ensure_index()
+            if digest not in self.index:
+                return None
+            try:
+                cached_version = version_path.read_text()
+            except FileNotFoundError:
+                cached_version = None
+            if cached_version != (version or ''):
+                self._remove(digest)
+                return None
+            try:
+                # 其他进程共用目录时可能已被删除
+                f = open(data_path, mode)
+            except FileNotFoundError:
+                self._remove(digest)
+                return None
+            self.index.move_to_end(digest)
+            os.utime(data_path)
+            return f
+
+    def temp_path(self, key):
+        """下载用的临时路径，下载完成后交给put"""
+        with self.lock:
+            self._ensure_index()
+        return self.root / '{}.{}.{}.tmp'.format(self._digest(key), os.getpid(), threading.get_ident())
+
+    def put(self, key, version, src, mode='rb'):
+        """把已下载到src的文件移入缓存，返回打开的缓存文件"""
+        digest = self._digest(key)
+        data_path, version_path = self._paths(digest)
+        size = os.path.getsize(src)
+        with self.lock:
+            self._ensure_index()
+            self._remove(digest)
+            os.replace(src, data_path)
+            version_path.write_text(version or '')
+            f = open(data_path, mode)
+            self.index[digest] = size
+            self.total_size += size
+            while self.total_size > self.max_size and len(self.index) > 1:
+                oldest = next(iter(self.index))
+                self._remove(oldest)
+        return f
+
+    def delete(self, key):
+        with self.lock:
+            self._ensure_index()
+            self._remove(self._digest(key))
@@ -0,0 +1,74 @@
+import logging
+import multiprocessing
+import posixpath
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from PIL import Image, ImageOps
+
+_executor = None
+_callback_executor = None
+_executor_lock = Lock()
+
+
+def get_executor(max_workers):
+    """缩放图片是CPU密集的，放到进程池执行；用spawn启动，子进程不继承web进程的线程和数据库连接"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def get_callback_executor():
+    """回调中有上传、写库等IO，放到线程池执行，不占用进程池的结果线程"""
+    global _callback_executor
+    if _callback_executor is None:
+        with _executor_lock:
+            if _callback_executor is None:
+                _callback_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+    return _callback_executor
+
+
+def variant_name(name, key, fmt='webp'):
+    """衍生图与原图放在同一目录：avatar/20210101/a.png -> avatar/20210101/a.<key>.webp"""
+    root, _ = posixpath.splitext(name)
+    return '{}.{}.{}'.format(root, key, fmt)
+
+
+def make_variants(data, specs, quality=80):
+    """
+    在子进程中执行，只依赖PIL。specs为 {key: (width, height)}，按比例缩小到不超过该尺寸(不放大)，
+    返回 {key: webp字节}
+    """
+    result = {}
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+        for key, size in specs.items():
+            thumb = image.copy()
+            thumb.thumbnail(size, Image.LANCZOS)
+            buf = BytesIO()
+            thumb.save(buf, 'WEBP', quality=quality, method=4)
+            result[key] = buf.getvalue()
+    return result
+
+
+def submit_variants(data, specs, callback, max_workers=2):
+    """提交生成任务，完成后在回调线程池中以 callback(variants) 回调，失败只记录日志"""
+    def _callback(future):
+        try:
+            callback(future.result())
+        except Exception as ex:
+            logging.error('Generate image variants failed', exc_info=ex)
+
+    def _done(future):
+        get_callback_executor().submit(_callback, future)
+
+    future = get_executor(max_workers).submit(make_variants, data, specs)
+    future.add_done_callback(_done)
+    return future
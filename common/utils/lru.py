@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    进程内线程安全的LRU缓存，超过maxsize时淘汰最久未使用的条目；ttl(秒)为None时不过期
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            value, expire_at = item
+            if expire_at is not None and expire_at < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expire_at = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.data[key] = (value, expire_at)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.data)
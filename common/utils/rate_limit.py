@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import deque
+
+from django.core.cache import caches
+
+from common.utils.lru import LRUCache
+
+
+class MemoryBackend:
+    """
+    进程内的滑动窗口日志，精确但只在单个进程内生效
+    """
+
+    def __init__(self, maxsize=100000):
+        self.windows = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        now = time.monotonic()
+        with self.lock:
+            hits = self.windows.get(key)
+            if hits is None:
+                hits = deque()
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            allowed = len(hits) < limit
+            if allowed:
+                hits.append(now)
+            self.windows.set(key, hits, ttl=window)
+            return allowed
+
+    def reset(self, key, window):
+        self.windows.delete(key)
+
+
+class CacheBackend:
+    """
+    基于Django cache的滑动窗口计数(用上一个固定窗口按时间加权估算)，配置redis等共享cache后可跨进程生效
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        current = int(now // window)
+        current_key = 'rl:{}:{}'.format(key, current)
+        previous_key = 'rl:{}:{}'.format(key, current - 1)
+        counts = self.cache.get_many([current_key, previous_key])
+        weight = (window - now % window) / window
+        if counts.get(previous_key, 0) * weight + counts.get(current_key, 0) >= limit:
+            return False
+        self.cache.add(current_key, 0, window * 2)
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            self.cache.set(current_key, 1, window * 2)
+        return True
+
+    def reset(self, key, window):
+        current = int(time.time() // window)
+        self.cache.delete_many(['rl:{}:{}'.format(key, i) for i in (current, current - 1)])
+
+
+class SlidingWindowLimiter:
+    """window秒内最多允许limit次，被拒绝的请求不计入次数"""
+
+    def __init__(self, limit, window, backend=None):
+        self.limit = limit
+        self.window = window
+        self.backend = backend or MemoryBackend()
+
+    def allow(self, key):
+        return self.backend.hit(key, self.limit, self.window)
+
+    def reset(self, key):
+        self.backend.reset(key, self.window)
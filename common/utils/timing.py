@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RequestTiming:
+    """
+    单个请求的耗时统计，单位均为毫秒
+    db_wrapper 通过 connection.execute_wrapper 挂载，统计SQL耗时与次数
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = OrderedDict()
+        self.db_queries = 0
+
+    def add(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0) + ms
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.add('db', (time.perf_counter() - start) * 1000)
+
+    def total(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def get(self, name):
+        return self.spans.get(name, 0)
+
+    def server_timing(self):
+        items = ['total;dur={:.1f}'.format(self.total())]
+        for name, ms in self.spans.items():
+            item = '{};dur={:.1f}'.format(name, ms)
+            if name == 'db':
+                item += ';desc="{} queries"'.format(self.db_queries)
+            items.append(item)
+        return ', '.join(items)
@@ -1,11 +1,22 @@
+import codecs
+import csv
+import mimetypes
+import os
+from contextlib import nullcontext
 from tempfile import NamedTemporaryFile
 
-from django.core.paginator import Paginator
-from django.http import Http404, FileResponse
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import QuerySet, Max, Count
+from django.http import Http404, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django_filters import rest_framework as filters
 from openpyxl import Workbook
 
-from common.views.resp import JSONResponse
+from common.db import router
+from common.helper import md5
+from common.views.pagination import CursorPaginator, InvalidCursor, CachedCountPaginator
+from common.views.resp import JSONResponse, content_disposition
 
 
 class GeneralCodeMixin:
@@ -27,6 +38,14 @@ class GeneralCodeMixin:
 
 class BaseAPIViewMixin:
 
+    def timing_span(self, name):
+        timing = getattr(self, 'timing', None)
+        return timing.span(name) if timing else nullcontext()
+
+    def serialized_data(self, serializer):
+        with self.timing_span('serialize'):
+            return serializer.data
+
     @classmethod
     def resp_payload(cls, code, data=None, msg=None):
         if not msg and code in cls.DEFAULT_MSG:
@@ -44,22 +63,92 @@ class BaseAPIViewMixin:
         return JSONResponse(payload, status=status)
 
 
-class RetrieveModelMixin(BaseAPIViewMixin):
+class ConditionalGetMixin(BaseAPIViewMixin):
+    # 开启后GET请求根据数据的最后修改时间和数量返回ETag/Last-Modified，客户端缓存有效时直接返回304，不做序列化
+    enable_conditional_get = False
+    conditional_field = 'modified'
+    # 如 {'max_age': 60, 'public': True}，参数同 django.utils.cache.patch_cache_control
+    cache_control = None
+
+    conditional_headers = None
+    # 条件GET时查到的准确总数，分页直接使用
+    conditional_count = None
+
+    def conditional_state(self, queryset):
+        # 总数不用分页缓存的值：其他进程删除非最新的数据后缓存的总数可能还是旧的，ETag会误判为未变化
+        result = queryset.order_by().aggregate(last_modified=Max(self.conditional_field), count=Count('pk'))
+        return result['last_modified'], result['count']
+
+    def conditional_response(self, request, queryset):
+        """
+        客户端缓存仍然有效时返回304响应，否则返回None
+        """
+        if not self.enable_conditional_get:
+            return None
+        last_modified, count = self.conditional_state(queryset)
+        self.conditional_count = count
+        if not count:
+            return None
+        # ETag用完整精度的修改时间，同一秒内的多次修改也能区分；Last-Modified只能精确到秒
+        etag = '"{}"'.format(md5('{}|{}|{}'.format(
+            request.get_full_path(), last_modified.isoformat() if last_modified else None, count)))
+        last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+        self.conditional_headers = {'ETag': etag}
+        if last_modified_ts:
+            self.conditional_headers['Last-Modified'] = http_date(last_modified_ts)
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified_ts)
+        return self.finalize_conditional(response) if response is not None else None
+
+    def finalize_conditional(self, response):
+        for k, v in (self.conditional_headers or {}).items():
+            response[k] = v
+        if self.cache_control is not None:
+            patch_cache_control(response, **self.cache_control)
+        return response
+
+
+class RetrieveModelMixin(ConditionalGetMixin):
     def retrieve(self, request, *args, **kwargs):
+        if self.enable_conditional_get:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = self.filter_queryset(self.get_queryset()).filter(
+                    **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+                )
+                response = self.conditional_response(request, queryset)
+            except (TypeError, ValueError, ValidationError):
+                # 与get_object_or_404一致，类型不对的主键视为不存在
+                return self.ok_resp(self.CODE_RESOURCE_NOT_FOUND)
+            if response is not None:
+                return response
+
         instance = self.get_object()
         if not instance:
             return self.ok_resp(self.CODE_RESOURCE_NOT_FOUND)
 
         serializer = self.get_serializer(instance, many=False)
-        return self.ok_resp(self.CODE_OK, data={'item': serializer.data})
+        return self.finalize_conditional(
+            self.ok_resp(self.CODE_OK, data={'item': self.serialized_data(serializer)})
+        )
 
 
-class ListModelMixin(BaseAPIViewMixin):
+class ListModelMixin(ConditionalGetMixin):
     enable_pagination = True
     page_query_param = 'page'
     page_size_query_param = 'size'
     default_page_size = 10
 
+    # 开启后使用游标分页，响应中以next/prev代替page/total_page/total_count
+    enable_cursor_pagination = False
+    cursor_query_param = 'cursor'
+    # 默认使用queryset/model的ordering
+    cursor_ordering = None
+
+    # total_count缓存秒数，0为每次都COUNT
+    count_cache_timeout = 30
+    # 无过滤条件时使用MySQL表统计信息中的估算行数作为total_count
+    estimate_count = False
+
     filter_backends = [filters.DjangoFilterBackend]
 
     def page_num(self, request):
@@ -72,28 +161,64 @@ class ListModelMixin(BaseAPIViewMixin):
         size = request.query_params.get(self.page_size_query_param)
         return int(size) if size else self.default_page_size
 
+    count_paginator = None
+
+    def get_count_paginator(self, queryset, page_size):
+        # 同一个请求中只创建一个paginator，总数只取一次
+        paginator = self.count_paginator
+        if paginator is None or paginator.object_list is not queryset or paginator.per_page != page_size:
+            paginator = self.count_paginator = CachedCountPaginator(queryset, page_size,
+                                                                    cache_timeout=self.count_cache_timeout,
+                                                                    estimate=self.estimate_count)
+        return paginator
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        response = self.conditional_response(request, queryset)
+        if response is not None:
+            return response
+        return self.finalize_conditional(self.list_response(request, queryset))
 
+    def list_response(self, request, queryset):
         if not self.enable_pagination:
             serializer = self.get_serializer(queryset, many=True)
             return self.ok_resp(self.CODE_OK, data={
-                'items': serializer.data
+                'items': self.serialized_data(serializer)
             })
 
+        if self.enable_cursor_pagination:
+            return self.cursor_list(request, queryset)
+
         page_num = self.page_num(request)
         page_size = self.page_size(request)
-        paginator = Paginator(queryset, page_size)
+        paginator = self.get_count_paginator(queryset, page_size)
+        if self.conditional_count is not None:
+            paginator.count = self.conditional_count
         page = paginator.get_page(page_num)
         serializer = self.get_serializer(page.object_list, many=True)
         return self.ok_resp(self.CODE_OK, data={
-            'items': serializer.data,
+            'items': self.serialized_data(serializer),
             'page': page_num,
             'page_size': page_size,
             'total_page': paginator.num_pages,
             'total_count': paginator.count
         })
 
+    def cursor_list(self, request, queryset):
+        page_size = self.page_size(request)
+        paginator = CursorPaginator(queryset, page_size, ordering=self.cursor_ordering)
+        try:
+            items, next_cursor, prev_cursor = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            return self.ok_resp(self.CODE_INVALID_PARAMS, msg='无效的cursor')
+        serializer = self.get_serializer(items, many=True)
+        return self.ok_resp(self.CODE_OK, data={
+            'items': self.serialized_data(serializer),
+            'page_size': page_size,
+            'next': next_cursor,
+            'prev': prev_cursor,
+        })
+
 
 class CreateModelMixin(BaseAPIViewMixin):
     def create(self, request, *args, **kwargs):
@@ -101,7 +226,7 @@ class CreateModelMixin(BaseAPIViewMixin):
         serializer = self.get_serializer(data=data)
         if serializer.is_valid():
             serializer.save()
-            return self.ok_resp(self.CODE_OK, data={'item': serializer.data})
+            return self.ok_resp(self.CODE_OK, data={'item': self.serialized_data(serializer)})
         else:
             return self.ok_resp(self.CODE_INVALID_PARAMS, data={'errors': serializer.errors})
 
@@ -115,7 +240,7 @@ class UpdateModelMixin(BaseAPIViewMixin):
         serializer = self.get_serializer(instance, data=data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            return self.ok_resp(self.CODE_OK, data={'item': serializer.data})
+            return self.ok_resp(self.CODE_OK, data={'item': self.serialized_data(serializer)})
         else:
             return self.ok_resp(self.CODE_INVALID_PARAMS, data={'errors': serializer.errors})
 
@@ -137,20 +262,43 @@ class BaseRestfulMixin(RetrieveModelMixin,
 
     serializer_class = None
 
+    # 开启后list/retrieve读只读副本，用户自己写入后的短时间内仍读主库
+    use_read_replica = False
+
     def get(self, request, pk=None):
-        if not pk:
-            return self.list(request)
-        return self.retrieve(request)
+        with self.read_db_context(request):
+            if not pk:
+                return self.list(request)
+            return self.retrieve(request)
 
     def post(self, request):
+        self.mark_recent_write(request)
         return self.create(request)
 
     def put(self, request, pk):
+        self.mark_recent_write(request)
         return self.update(request)
 
     def delete(self, request, pk):
+        self.mark_recent_write(request)
         return self.destroy(request)
 
+    def read_consistency_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and getattr(user, 'pk', None):
+            return 'u:{}'.format(user.pk)
+        return 'ip:{}'.format(request.META.get('REMOTE_ADDR'))
+
+    def mark_recent_write(self, request):
+        if self.use_read_replica:
+            router.mark_recent_write(self.read_consistency_key(request))
+
+    def read_db_context(self, request):
+        if not self.use_read_replica or router.is_sticky(self.read_consistency_key(request)):
+            return nullcontext()
+        replica = router.choose_read_replica()
+        return router.use_read_db(replica) if replica else nullcontext()
+
     def get_object(self):
         try:
             return super().get_object()
@@ -163,15 +311,60 @@ class BaseDownloadMixin:
     filter_backends = [filters.DjangoFilterBackend]
     file_name = ''
 
+    # 设置为BaseExportJob的子类后支持后台导出：请求参数async为1/true，或export_in_background为True时，
+    # 只创建后台导出任务并返回任务信息；否则仍直接下载
+    export_job_model = None
+    export_job_serializer_class = None
+    export_in_background = False
+    export_background_query_param = 'async'
+
     def get(self, request):
         queryset = self.filter_queryset(self.get_queryset())
+        if self.use_export_job(request):
+            return self.create_export_job(request, queryset)
+
         data = self.download(queryset)
-        return FileResponse(data, as_attachment=True, filename=self.file_name)
+        file_name = self.get_file_name()
+        if hasattr(data, 'read'):
+            return FileResponse(data, as_attachment=True, filename=file_name)
+        # download返回bytes的生成器时，边生成边发送给客户端
+        content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(data, content_type=content_type)
+        response['Content-Disposition'] = content_disposition(file_name)
+        return response
+
+    def use_export_job(self, request):
+        if self.export_job_model is None:
+            return False
+        value = request.query_params.get(self.export_background_query_param)
+        if value is None:
+            return self.export_in_background
+        return value.lower() in ('1', 'true')
+
+    def create_export_job(self, request, queryset):
+        from common.utils.export_job import submit_export_job
+
+        job = self.export_job_model(file_name=self.get_file_name())
+        job.set_user(request.user)
+        job.save()
+        submit_export_job(self, queryset, job)
+        serializer = self.export_job_serializer_class(job)
+        return self.ok_resp(self.CODE_OK, data={'item': serializer.data})
+
+    def get_file_name(self):
+        return self.file_name
 
     def download(self, queryset):
         raise NotImplementedError()
 
 
+class _Echo:
+    """csv.writer的伪文件对象，writerow直接返回写入的内容"""
+
+    def write(self, value):
+        return value
+
+
 class BaseExcelComposeMixin:
     """
     sheets = (
@@ -183,26 +376,83 @@ class BaseExcelComposeMixin:
             ),
         }
     )
+    同一份sheets声明可以导出为xlsx，也可以导出为csv/tsv（多个sheet依次写入同一个文件）
     """
     sheets = ()
 
-    def create_excel(self, queryset):
-        wb = Workbook()
-        for index, sheet_info in enumerate(self.sheets):
+    EXPORT_XLSX = 'xlsx'
+    EXPORT_CSV = 'csv'
+    EXPORT_TSV = 'tsv'
+    export_formats = [EXPORT_XLSX, EXPORT_CSV, EXPORT_TSV]
+    export_format = EXPORT_XLSX
+    export_format_query_param = 'export_format'
+    # 每次从数据库读取的行数
+    export_chunk_size = 2000
+    # 后台导出时由导出任务设置，用于记录进度
+    export_job = None
+
+    def get_export_format(self):
+        export_format = self.request.query_params.get(self.export_format_query_param)
+        return export_format if export_format in self.export_formats else self.export_format
+
+    def get_file_name(self):
+        name = os.path.splitext(self.file_name)[0] if self.file_name else 'export'
+        return '{}.{}'.format(name, self.get_export_format())
+
+    def export(self, queryset):
+        export_format = self.get_export_format()
+        if export_format == self.EXPORT_CSV:
+            return self.create_csv(queryset)
+        if export_format == self.EXPORT_TSV:
+            return self.create_csv(queryset, delimiter='\t')
+        return self.create_excel(queryset)
+
+    def estimate_export_rows(self, queryset):
+        return sum(sheet_queryset.count() for _, sheet_queryset in self.iter_sheets(queryset))
+
+    def iter_sheets(self, queryset):
+        for sheet_info in self.sheets:
             if sheet_info.get('filter_queryset_method') is not None:
                 queryset = getattr(self, sheet_info.get('filter_queryset_method'))(queryset)
-            sheet = wb.create_sheet() if index > 0 else wb.active
-            self.write_to_sheet(sheet_info.get('title'), sheet, queryset, sheet_info['fields_map'])
+            yield sheet_info, queryset
+
+    def create_excel(self, queryset):
+        # write_only模式下行数据写入临时文件，内存占用不随行数增长
+        wb = Workbook(write_only=True)
+        for sheet_info, sheet_queryset in self.iter_sheets(queryset):
+            sheet = wb.create_sheet()
+            self.write_to_sheet(sheet_info.get('title'), sheet, sheet_queryset, sheet_info['fields_map'])
         tmp_file = NamedTemporaryFile()
         wb.save(tmp_file.name)
         tmp_file.seek(0)
         return tmp_file
 
+    def create_csv(self, queryset, delimiter=','):
+        writer = csv.writer(_Echo(), delimiter=delimiter)
+        # BOM让Excel能正确识别UTF-8
+        yield codecs.BOM_UTF8
+        for index, (sheet_info, sheet_queryset) in enumerate(self.iter_sheets(queryset)):
+            if index > 0:
+                yield writer.writerow([]).encode('UTF-8')
+            if len(self.sheets) > 1:
+                yield writer.writerow([sheet_info.get('title')]).encode('UTF-8')
+            for row in self.iter_rows(sheet_queryset, sheet_info['fields_map']):
+                yield writer.writerow(row).encode('UTF-8')
+
     def write_to_sheet(self, title, sheet, queryset, fields_map):
         sheet.title = title
-        header = ['序号'] + [f_map[0] for f_map in fields_map]
-        sheet.append(header)
+        for row in self.iter_rows(queryset, fields_map):
+            sheet.append(row)
+        return sheet
+
+    def iter_rows(self, queryset, fields_map):
+        yield ['序号'] + [f_map[0] for f_map in fields_map]
+        for row in self.iter_data_rows(queryset, fields_map):
+            yield row
+            if self.export_job is not None:
+                self.export_job.advance()
 
+    def iter_data_rows(self, queryset, fields_map):
         def _get_nested_attr(obj, attr):
             if not attr:
                 return '-'
@@ -212,11 +462,70 @@ class BaseExcelComposeMixin:
                     return '-'
             return obj
 
+        attr_names = [f_map[1] for f_map in fields_map]
+        if isinstance(queryset, QuerySet):
+            lookups, related = self.resolve_export_lookups(queryset.model, attr_names)
+            if lookups is not None:
+                # 全部是数据库字段时直接取tuple，不实例化model，外键字段由join一次取出
+                yield from self.iter_value_rows(queryset, lookups)
+                return
+            if related:
+                queryset = queryset.select_related(*related)
+            queryset = queryset.iterator(chunk_size=self.export_chunk_size)
+
         for index, q in enumerate(queryset):
-            attr_names = [f_map[1] for f_map in fields_map]
-            row = [index + 1] + [
+            yield [index + 1] + [
                 attr(q) if callable(attr) else _get_nested_attr(q, attr)
                 for attr in attr_names
             ]
-            sheet.append(row)
-        return sheet
+
+    def iter_value_rows(self, queryset, lookups):
+        fields = [lookup for lookup in lookups if lookup]
+        rows = queryset.values_list(*fields).iterator(chunk_size=self.export_chunk_size)
+        for index, values in enumerate(rows):
+            values = iter(values)
+            yield [index + 1] + [(next(values) or '-') if lookup else '-' for lookup in lookups]
+
+    @staticmethod
+    def resolve_export_lookups(model, attr_names):
+        """
+        把fields_map中 'author.nickname' 这样的路径转换为 'author__nickname'
+        返回 (lookups, related)：related为路径中可以select_related的外键；
+        存在callable或不能直接映射到数据库字段的路径(property、外键对象本身、多对多等)时lookups为None
+        """
+        lookups = []
+        related = set()
+        for attr in attr_names:
+            if callable(attr):
+                lookups = None
+                continue
+            if not attr:
+                if lookups is not None:
+                    lookups.append(None)
+                continue
+            lookup, attr_related = _resolve_field_path(model, attr)
+            related.update(attr_related)
+            if lookup is None:
+                lookups = None
+            elif lookups is not None:
+                lookups.append(lookup)
+        return lookups, sorted(related)
+
+
+def _resolve_field_path(model, attr):
+    names = attr.split('.')
+    related = []
+    for index, name in enumerate(names):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None, related
+        is_last = index == len(names) - 1
+        if field.is_relation:
+            if is_last or not (field.many_to_one or field.one_to_one):
+                return None, related
+            related.append('__'.join(names[:index + 1]))
+            model = field.related_model
+        elif not is_last:
+            return None, related
+    return '__'.join(names), related
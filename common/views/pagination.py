@@ -0,0 +1,218 @@
+import base64
+import json
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import cached_property
+
+from common.helper import md5, uuid_str
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _cursor_value(value):
+    # datetime需要保留微秒，否则会跳过/重复同一毫秒内的数据
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+class CursorPaginator:
+    """
+    基于排序字段的游标分页(keyset pagination)，不执行COUNT，也没有OFFSET深翻页的问题
+    ordering中的字段必须是本表的非空字段，末尾会自动追加主键保证排序唯一
+    """
+
+    def __init__(self, queryset, page_size, ordering=None):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.ordering = self.normalize_ordering(queryset, ordering)
+
+    @staticmethod
+    def normalize_ordering(queryset, ordering):
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        names = [o.lstrip('-') for o in ordering]
+        if 'pk' not in names and pk_name not in names:
+            desc = bool(ordering) and ordering[0].startswith('-')
+            ordering.append(('-' if desc else '') + pk_name)
+        return ordering
+
+    @staticmethod
+    def encode_cursor(values, reverse):
+        payload = json.dumps({'v': values, 'r': int(reverse)}, default=_cursor_value)
+        return base64.urlsafe_b64encode(payload.encode('UTF-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('UTF-8'))
+            values, reverse = payload['v'], bool(payload['r'])
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor()
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor()
+        return values, reverse
+
+    def keyset_q(self, values, reverse):
+        # (a, b, c) > (x, y, z) 展开为 a>x OR (a=x AND b>y) OR (a=x AND b=y AND c>z)
+        q = Q()
+        for index, order in enumerate(self.ordering):
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            cond = Q(**{'{}__{}'.format(order.lstrip('-'), lookup): values[index]})
+            for prev_order, prev_value in zip(self.ordering[:index], values[:index]):
+                cond &= Q(**{prev_order.lstrip('-'): prev_value})
+            q |= cond
+        return q
+
+    def values_of(self, obj):
+        return [getattr(obj, order.lstrip('-')) for order in self.ordering]
+
+    def page(self, cursor=None):
+        """
+        返回 (当前页数据, 下一页cursor, 上一页cursor)，没有下一页/上一页时对应的cursor为None
+        """
+        values, reverse = self.decode_cursor(cursor) if cursor else (None, False)
+        queryset = self.queryset
+        ordering = self.ordering
+        if values is not None:
+            try:
+                queryset = queryset.filter(self.keyset_q(values, reverse))
+            except (ValidationError, ValueError, TypeError):
+                # 被篡改的cursor，值无法转换为字段类型
+                raise InvalidCursor()
+        if reverse:
+            ordering = [o[1:] if o.startswith('-') else '-' + o for o in ordering]
+
+        items = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if reverse:
+            items.reverse()
+
+        next_cursor = prev_cursor = None
+        if items:
+            if reverse or has_more:
+                next_cursor = self.encode_cursor(self.values_of(items[-1]), False)
+            if (values is not None and not reverse) or (reverse and has_more):
+                prev_cursor = self.encode_cursor(self.values_of(items[0]), True)
+        return items, next_cursor, prev_cursor
+
+
+_watched_models = set()
+
+
+def count_cache():
+    return caches[settings.PAGINATION_COUNT_CACHE]
+
+
+@checks.register(checks.Tags.caches)
+def check_count_cache(app_configs, **kwargs):
+    # 写入只让本进程缓存的总数失效，其他进程在缓存过期前返回旧的total_count
+    if isinstance(count_cache(), LocMemCache):
+        return [checks.Warning(
+            'PAGINATION_COUNT_CACHE使用的是进程内的LocMemCache，多进程部署时写入后其他进程的分页总数不会失效',
+            hint='把PAGINATION_COUNT_CACHE指向本地文件、redis等多进程共享的cache',
+            id='common.W002',
+        )]
+    return []
+
+
+def _count_version_key(model):
+    return 'count:ver:{}'.format(model._meta.label)
+
+
+def _count_version(model):
+    key = _count_version_key(model)
+    version = count_cache().get(key)
+    if version is None:
+        # 版本号丢失(被淘汰、cache重启)时生成新的随机版本，之前缓存的总数都不会再命中
+        version = uuid_str()
+        if not count_cache().add(key, version, None):
+            version = count_cache().get(key) or version
+    return version
+
+
+def _bump_count_version(sender, **kwargs):
+    count_cache().set(_count_version_key(sender), uuid_str(), None)
+
+
+def watch_model(model):
+    """
+    model有写入时使其已缓存的总数失效；只在第一次缓存该model的总数时注册，
+    避免全局的delete信号让所有model的批量删除都失去fast delete
+    bulk_create/update等不发信号的写入依赖缓存的过期时间
+    """
+    if model in _watched_models:
+        return
+    uid = 'count_cache:{}'.format(model._meta.label)
+    post_save.connect(_bump_count_version, sender=model, dispatch_uid=uid)
+    post_delete.connect(_bump_count_version, sender=model, dispatch_uid=uid)
+    _watched_models.add(model)
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    version = _count_version(queryset.model)
+    return 'count:{}:{}:{}'.format(queryset.model._meta.label, version, md5(sql + repr(params)))
+
+
+def estimated_count(queryset):
+    """
+    无过滤条件时直接读MySQL表统计信息中的行数(InnoDB下为估算值)，其他情况返回None
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.combinator:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else None
+
+
+class CachedCountPaginator(Paginator):
+    """
+    总数按 model + 查询SQL 在PAGINATION_COUNT_CACHE中缓存cache_timeout秒，model有写入时失效
+    estimate为True时，无过滤条件的查询使用表统计信息中的估算行数
+    """
+
+    def __init__(self, object_list, per_page, cache_timeout=0, estimate=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_timeout = cache_timeout
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if self.estimate:
+            count = estimated_count(queryset)
+            if count is not None:
+                return count
+        if not self.cache_timeout:
+            return queryset.count()
+
+        watch_model(queryset.model)
+        try:
+            key = count_cache_key(queryset)
+        except EmptyResultSet:
+            return 0
+        count = count_cache().get(key)
+        if count is None:
+            count = queryset.count()
+            count_cache().set(key, count, self.cache_timeout)
+        return count
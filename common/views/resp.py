@@ -1,5 +1,65 @@
+import re
+from urllib.parse import quote
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.response import Response
 
 
 class JSONResponse(Response):
     pass
+
+
+def content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        return 'attachment; filename="{}"'.format(filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''{}".format(quote(filename))
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _read_range(file, length, block_size=64 * 1024):
+    try:
+        while length > 0:
+            data = file.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def ranged_file_response(request, file, size, filename):
+    """
+    支持单个Range请求(断点续传)的文件下载，没有Range头时返回完整文件
+    """
+    match = _RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    if not match or match.groups() == ('', ''):
+        response = FileResponse(file, as_attachment=True, filename=filename)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = match.groups()
+    if start == '':
+        # bytes=-500 表示最后500个字节
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+
+    file.seek(start)
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(file, length), status=206,
+                                     content_type='application/octet-stream')
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition(filename)
+    return response
@@ -1,12 +1,19 @@
+import json
 import logging
 import random
+from collections import defaultdict
+from contextlib import ExitStack
 
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import close_old_connections, connections
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.generics import GenericAPIView
 
 from common.models.log import BaseApiLog
 from common.models.user import BaseUser
+from common.utils.batch_writer import BatchWriter
+from common.utils.timing import RequestTiming
 from common.views.resp import JSONResponse
 from common.helper import get_timestamp
 
@@ -24,19 +31,134 @@ def suppress_exception(func):
     return inner
 
 
+def _log_item_str(k, v):
+    return '[{}|{}]'.format(k, v or '')
+
+
+def _json_payload(payload):
+    if payload is None:
+        return None
+    try:
+        json.dumps(payload)
+        return payload
+    except (TypeError, ValueError):
+        return str(payload)
+
+
+REDACTED = '******'
+
+
+def redact_payload(payload, keys):
+    """把键名中包含keys任一项(不区分大小写)的值替换掉，避免密码等明文写入日志和日志表"""
+    if isinstance(payload, dict):
+        return {
+            k: REDACTED if any(key in str(k).lower() for key in keys) else redact_payload(v, keys)
+            for k, v in payload.items()
+        }
+    if isinstance(payload, (list, tuple)):
+        return [redact_payload(v, keys) for v in payload]
+    return payload
+
+
+def _write_log_lines(record):
+    logger = logging.getLogger(record['logger'])
+    payload = record['payload']
+    logger.info('{req}{session}{user} {method}: {path}{query} {payload}'.format(
+        req=_log_item_str('Req', record['req_id']),
+        session=_log_item_str('S', record['sessionid']),
+        user=_log_item_str('U', record['user_id']),
+        method=record['method'],
+        path=record['path'],
+        query=record['query'],
+        payload=str(payload) if payload is not None else None
+    ))
+
+    prefix = '{resp}{session}'.format(resp=_log_item_str('Resp', record['req_id']),
+                                      session=_log_item_str('S', record['resp_sessionid']))
+    timing = record['timing']
+    spent = 'Spent: {}ms DB: {}ms/{}q'.format(timing['total'], timing['db'], timing['db_queries'])
+    if record['resp_status'] == 200:
+        if 'resp_code' in record:
+            logger.info('{}: Code: {} Msg: {} {}'.format(prefix, record['resp_code'], record['resp_msg'], spent))
+        else:
+            logger.info('{}: {} {}'.format(prefix, record['resp_repr'], spent))
+    else:
+        logger.warning('{}: StatusCode: {} {}'.format(prefix, record['resp_status'], spent))
+
+
+def _api_log_instance(model, record):
+    instance = model(
+        sessionid=record['sessionid'],
+        ip=record['ip'],
+        user_agent=(record['user_agent'] or '')[:500],
+        method=model.method_value(record['method']),
+        path=record['path'][:200],
+        route=(record['route'] or '')[:200] or None,
+        query=record['query'][:500],
+        payload=_json_payload(record['payload']),
+        req_id=record['req_id'],
+        resp_status=record['resp_status'],
+        resp_code=record.get('resp_code'),
+        received=record['received'],
+        handled=record['handled'],
+        spent=record['timing']['total'],
+        db_spent=record['timing']['db'],
+        db_queries=record['timing']['db_queries'],
+        serialize_spent=record['timing']['serialize'],
+        render_spent=record['timing']['render'],
+    )
+    try:
+        model._meta.get_field('user')
+        instance.user_id = record['user_id']
+    except FieldDoesNotExist:
+        pass
+    return instance
+
+
+def write_api_logs(records):
+    """后台线程中执行：写日志文件，并按model批量插入数据库"""
+    close_old_connections()
+    instances = defaultdict(list)
+    for record in records:
+        _write_log_lines(record)
+        model = record['model']
+        if model is not None:
+            instances[model].append(_api_log_instance(model, record))
+    for model, items in instances.items():
+        model.objects.bulk_create(items, batch_size=len(items))
+        if model.rollup_model is not None:
+            # bulk_create时auto_now的date已经写回到各个对象上
+            model.rollup_model.rollup(items)
+
+
+api_log_writer = BatchWriter('api_log', write_api_logs,
+                             max_queue_size=settings.API_LOG_QUEUE_SIZE,
+                             batch_size=settings.API_LOG_BATCH_SIZE,
+                             flush_interval=settings.API_LOG_FLUSH_INTERVAL)
+
+
 class LogApiView(GenericAPIView):
     """
     接收req和发送resp都会进行相应的日志记录，并且把记录保存到数据库中
+    日志在请求线程中只会组装成record放入队列，格式化、写文件和入库都由api_log_writer在后台批量完成
     """
     skip_log_exc_classes = [PermissionDenied]
 
     need_log_body = True
+    # 请求体中键名包含这些词的字段不记录原值
+    sensitive_log_keys = ('password', 'secret', 'token')
+    # BaseApiLog的子类，为None时只写日志文件
+    api_log_model = None
+    # 在响应头中返回Server-Timing
+    enable_server_timing = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.req_id = random.randrange(1, 1000)
         self.user = None
+        self.log_record = None
+        self.timing = None
 
     def initialize_request(self, request, *args, **kwargs):
         req = super().initialize_request(request, *args, **kwargs)
@@ -51,7 +173,17 @@ class LogApiView(GenericAPIView):
             self.log_request(request)
 
     def dispatch(self, request, *args, **kwargs):
-        response = super().dispatch(request, *args, **kwargs)
+        self.timing = RequestTiming()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(self.timing.db_wrapper))
+            response = super().dispatch(request, *args, **kwargs)
+            if not getattr(response, 'is_rendered', True):
+                # 提前渲染，把渲染耗时也统计进来
+                with self.timing.span('render'):
+                    response.render()
+        if self.enable_server_timing:
+            response['Server-Timing'] = self.timing.server_timing()
         self.log_response(response)
         return response
 
@@ -72,34 +204,48 @@ class LogApiView(GenericAPIView):
         params = ['{}={}'.format(k, v) for k, v in query_params.items()]
         return ("?" + "&".join(params)) if params else ''
 
-    def log_item_str(self, k, v):
-        return '[{}|{}]'.format(k, v or '')
-
     def log_request(self, request):
         user_id = request.user.pk if isinstance(request.user, BaseUser) else None
-        req_data_str = None
+        payload = None
         if self.need_log_body and request.method != 'GET':
-            req_data_str = str(request.data)
-        msg = '{req}{session}{user} {method}: {path}{query} {payload}'.format(
-            req=self.log_item_str('Req', self.req_id),
-            session=self.log_item_str('S', request.headers.get('X-SESSIONID')),
-            user=self.log_item_str('U', user_id),
-            method=request.method,
-            path=request.path,
-            query=self.query_params_to_str(request),
-            payload=req_data_str
-        )
-        self.logger.info(msg)
+            payload = request.data.dict() if hasattr(request.data, 'dict') else request.data
+            payload = redact_payload(payload, self.sensitive_log_keys)
+        self.log_record = {
+            'logger': self.logger.name,
+            'model': self.api_log_model if settings.API_LOG_SAVE_DB else None,
+            'req_id': self.req_id,
+            'sessionid': request.headers.get('X-SESSIONID'),
+            'user_id': user_id,
+            'ip': request.META.get('REMOTE_ADDR'),
+            'user_agent': request.META.get('HTTP_USER_AGENT'),
+            'method': request.method,
+            'path': request.path,
+            'route': request.resolver_match.route if request.resolver_match else None,
+            'query': self.query_params_to_str(request),
+            'payload': payload,
+            'received': getattr(request, 'init_ts', None),
+        }
 
     def log_response(self, response):
-        prefix = '{resp}{session}'.format(resp=self.log_item_str('Resp', self.req_id),
-                                          session=self.log_item_str('S', response.headers.get('X-SESSIONID')))
-        if response.status_code == 200:
-            if isinstance(response, JSONResponse):
-                code = response.data['code']
-                msg = response.data['msg']
-                self.logger.info('{}: Code: {} Msg: {}'.format(prefix, code, msg))
-            else:
-                self.logger.info('{}: {}'.format(prefix, response))
+        record = self.log_record
+        if record is None:
+            # initial之前就结束了请求，没有请求信息可记录
+            return
+        record['handled'] = get_timestamp()
+        timing = self.timing
+        record['timing'] = {
+            'total': int(timing.total()),
+            'db': int(timing.get('db')),
+            'db_queries': timing.db_queries,
+            'serialize': int(timing.get('serialize')),
+            'render': int(timing.get('render')),
+        }
+        record['resp_status'] = response.status_code
+        record['resp_sessionid'] = response.headers.get('X-SESSIONID')
+        if isinstance(response, JSONResponse) and isinstance(response.data, dict):
+            record['resp_code'] = response.data.get('code')
+            record['resp_msg'] = response.data.get('msg')
         else:
-            self.logger.warning('{}: StatusCode: {} '.format(prefix, response.status_code))
+            record['resp_repr'] = repr(response)
+        api_log_writer.put(record)
+        self.log_record = None